@@ -0,0 +1,176 @@
+import uasyncio as asyncio
+from time import ticks_ms, ticks_add, ticks_diff
+from ucollections import OrderedDict
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# レスポンスをそのままバッファに溜める書き出しストリーム
+class _CaptureWriter:
+    def __init__(self, writer):
+        self._writer = writer
+        self.buf = bytearray()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.buf.extend(data)
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return self._writer.get_extra_info(name)
+
+# ルートハンドラのレスポンスキャッシュ
+# シリアライズ済みのレスポンス(ステータス行+ヘッダ+内容)を TTL 付きで保持し、
+# 合計サイズが上限を超えた場合は最も使われていないものから破棄する (LRU)
+class TMiniResponseCache:
+
+    # コンストラクタ
+    # max_bytes: キャッシュするレスポンスの合計サイズの上限
+    def __init__(self, max_bytes=8 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (有効期限, レスポンス)
+        self._size = 0
+        self._pending = {}              # key -> 実行中のハンドラの完了を通知する Event
+        self.hits = 0
+        self.misses = 0
+
+    # キャッシュからレスポンスを取得する
+    # key: (method, path, query_string, 応答の形式, オリジン)
+    # return: レスポンス / ない場合や期限切れの場合は None
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if ticks_diff(entry[0], ticks_ms()) <= 0:
+            self._size -= len(entry[1])
+            return None
+        # 最近使ったものとして末尾に移す
+        self._entries[key] = entry
+        return entry[1]
+
+    # レスポンスをキャッシュする
+    # ttl: 有効期間(秒)
+    def put(self, key, data, ttl):
+        self._remove(key)
+        if len(data) > self.max_bytes:
+            return
+        while self._entries and self._size + len(data) > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        self._entries[key] = (ticks_add(ticks_ms(), int(ttl * 1000)), data)
+        self._size += len(data)
+
+    # キャッシュを破棄する
+    # path: 指定したパスのレスポンスのみ破棄する (省略時は全て)
+    def invalidate(self, path=None):
+        if path is None:
+            self._entries = OrderedDict()
+            self._size = 0
+            return
+        for key in [k for k in self._entries if k[1] == path]:
+            self._remove(key)
+
+    # キャッシュから取得し、ない場合は producer を実行してキャッシュする
+    # 同じキーのハンドラが実行中の場合は、その完了を待って結果を共有する (single-flight)
+    # producer: (レスポンス, TTL秒) を返す async 関数. TTL が 0 の場合はキャッシュしない
+    # return: レスポンス / 失敗した場合は None
+    async def fetch(self, key, producer):
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        event = self._pending.get(key, None)
+        if event is not None:
+            await event.wait()
+            data = self.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+
+        self.misses += 1
+        event = self._pending[key] = asyncio.Event()
+        try:
+            data, ttl = await producer()
+            if data is not None and ttl:
+                self.put(key, data, ttl)
+            return data
+        finally:
+            if self._pending.get(key, None) is event:
+                del self._pending[key]
+            event.set()
+
+    # 統計情報
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+# 見つからなかった静的ファイルのパスのキャッシュ
+# /favicon.ico や /.env など繰り返し来るリクエストを、ファイルシステムもルートの一覧も探さずに 404 / 405 で返すために使う
+# 件数の上限を超えた場合は最も使われていないものから破棄し (LRU)、ttl 秒を過ぎたものは探し直す
+class TMiniNegativeCache:
+    max_path = 96       # キャッシュするパスの長さの上限 (長いパスはキャッシュしない)
+
+    # コンストラクタ
+    # max_entries: キャッシュするパスの数の上限 (0: キャッシュしない)
+    # ttl        : 有効期間(秒)
+    def __init__(self, max_entries=32, ttl=60):
+        self.max_entries = max_entries
+        self.ttl_ms = int(ttl * 1000)
+        self._entries = OrderedDict()   # path -> (有効期限, 使えるメソッドのリスト)
+        self.hits = 0
+
+    # 見つからなかったパスとしてキャッシュされている場合は、記録したメソッドのリストを返す
+    # return: None: キャッシュされていない / 空のリスト: 404 / それ以外: 405 の Allow に使うメソッドのリスト
+    def get(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return None
+        if ticks_diff(entry[0], ticks_ms()) <= 0:
+            return None
+        # 最近使ったものとして末尾に移す
+        self._entries[path] = entry
+        self.hits += 1
+        return entry[1]
+
+    # 見つからなかったパスを記録する
+    # allow: パスに対応するルートで使えるメソッドのリスト (ルートがない場合は空のリスト)
+    def add(self, path, allow=()):
+        if not self.max_entries or len(path) > self.max_path:
+            return
+        self._entries.pop(path, None)
+        while len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[path] = (ticks_add(ticks_ms(), self.ttl_ms), allow)
+
+    # キャッシュを破棄する (wwwroot にファイルを追加した場合に呼び出す)
+    # path: 指定したパスのみ破棄する (省略時は全て)
+    def invalidate(self, path=None):
+        if path is None:
+            self._entries = OrderedDict()
+        else:
+            self._entries.pop(path, None)
+
+    # 統計情報
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+        }
@@ -0,0 +1,367 @@
+import ustruct
+from json import dumps as json_dumps, loads as json_loads
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+MIME_JSON = 'application/json'
+MIME_CBOR = 'application/cbor'
+MIME_MSGPACK = 'application/msgpack'
+
+# 単精度で誤差なく表せる場合は 4バイトの float にする
+def _is_float32(value):
+    return ustruct.unpack('>f', ustruct.pack('>f', value))[0] == value
+
+##-------------------------------------------------------------------------
+## CBOR (RFC 8949)
+##-------------------------------------------------------------------------
+
+# 先頭バイト(メジャータイプ+追加情報)と長さを書き込む
+def _cbor_head(buf, major, n):
+    major <<= 5
+    if n < 24:
+        buf.append(major | n)
+    elif n < 0x100:
+        buf.append(major | 24)
+        buf.append(n)
+    elif n < 0x10000:
+        buf.append(major | 25)
+        buf.extend(ustruct.pack('>H', n))
+    elif n < 0x100000000:
+        buf.append(major | 26)
+        buf.extend(ustruct.pack('>I', n))
+    else:
+        buf.append(major | 27)
+        buf.extend(ustruct.pack('>Q', n))
+
+def _cbor_encode(buf, obj):
+    if obj is None:
+        buf.append(0xf6)
+    elif obj is True:
+        buf.append(0xf5)
+    elif obj is False:
+        buf.append(0xf4)
+    elif isinstance(obj, int):
+        if obj >= 0:
+            _cbor_head(buf, 0, obj)
+        else:
+            _cbor_head(buf, 1, -1 - obj)
+    elif isinstance(obj, float):
+        if _is_float32(obj):
+            buf.append(0xfa)
+            buf.extend(ustruct.pack('>f', obj))
+        else:
+            buf.append(0xfb)
+            buf.extend(ustruct.pack('>d', obj))
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _cbor_head(buf, 3, len(data))
+        buf.extend(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        _cbor_head(buf, 2, len(obj))
+        buf.extend(obj)
+    elif isinstance(obj, dict):
+        _cbor_head(buf, 5, len(obj))
+        for key, value in obj.items():
+            _cbor_encode(buf, key)
+            _cbor_encode(buf, value)
+    elif isinstance(obj, (list, tuple)):
+        _cbor_head(buf, 4, len(obj))
+        for value in obj:
+            _cbor_encode(buf, value)
+    else:
+        # イテレータは長さを決めずに配列として出力する
+        buf.append(0x9f)
+        for value in obj:
+            _cbor_encode(buf, value)
+        buf.append(0xff)
+
+# 値を CBOR にする
+# obj: None / bool / int / float / str / bytes / list / tuple / dict / イテレータ(配列として出力)
+def cbor_dumps(obj):
+    buf = bytearray()
+    _cbor_encode(buf, obj)
+    return buf
+
+# 長さ(追加情報)を読み込む
+def _cbor_arg(data, pos, info):
+    if info < 24:
+        return info, pos
+    if info == 24:
+        return data[pos], pos + 1
+    if info == 25:
+        return ustruct.unpack_from('>H', data, pos)[0], pos + 2
+    if info == 26:
+        return ustruct.unpack_from('>I', data, pos)[0], pos + 4
+    if info == 27:
+        return ustruct.unpack_from('>Q', data, pos)[0], pos + 8
+    if info == 31:
+        return None, pos
+    raise ValueError('cbor: invalid length')
+
+# 半精度の float を変換する
+def _half_to_float(h):
+    exp = (h >> 10) & 0x1f
+    mant = h & 0x3ff
+    if exp == 0:
+        value = mant * 2.0 ** -24
+    elif exp == 31:
+        value = float('inf') if mant == 0 else float('nan')
+    else:
+        value = (mant + 1024) * 2.0 ** (exp - 25)
+    return -value if h & 0x8000 else value
+
+def _cbor_decode(data, pos):
+    head = data[pos]
+    pos += 1
+    major = head >> 5
+    info = head & 0x1f
+    if major == 7:
+        if info == 20:
+            return False, pos
+        if info == 21:
+            return True, pos
+        if info == 22 or info == 23:
+            return None, pos
+        if info == 25:
+            return _half_to_float(ustruct.unpack_from('>H', data, pos)[0]), pos + 2
+        if info == 26:
+            return ustruct.unpack_from('>f', data, pos)[0], pos + 4
+        if info == 27:
+            return ustruct.unpack_from('>d', data, pos)[0], pos + 8
+        raise ValueError('cbor: unsupported simple value')
+
+    n, pos = _cbor_arg(data, pos, info)
+    if major == 0:
+        return n, pos
+    if major == 1:
+        return -1 - n, pos
+    if major == 2 or major == 3:
+        if n is None:
+            raise ValueError('cbor: indefinite string')
+        value = bytes(data[pos:pos + n])
+        return (value.decode() if major == 3 else value), pos + n
+    if major == 4:
+        items = []
+        while n is None or len(items) < n:
+            if n is None and data[pos] == 0xff:
+                pos += 1
+                break
+            value, pos = _cbor_decode(data, pos)
+            items.append(value)
+        return items, pos
+    if major == 5:
+        items = {}
+        count = 0
+        while n is None or count < n:
+            if n is None and data[pos] == 0xff:
+                pos += 1
+                break
+            key, pos = _cbor_decode(data, pos)
+            items[key], pos = _cbor_decode(data, pos)
+            count += 1
+        return items, pos
+    # major == 6 (タグ) はタグを無視して中身の値を返す
+    return _cbor_decode(data, pos)
+
+# CBOR を値にする
+def cbor_loads(data):
+    return _cbor_decode(data, 0)[0]
+
+##-------------------------------------------------------------------------
+## MessagePack
+##-------------------------------------------------------------------------
+
+# 長さによって書式を選ぶ
+# small: 固定長の書式の先頭バイトと上限 (なければ None)
+# codes: 8 / 16 / 32 ビットの長さを持つ書式の先頭バイト
+def _msgpack_head(buf, n, small, codes):
+    if small and n < small[1]:
+        buf.append(small[0] | n)
+    elif codes[0] and n < 0x100:
+        buf.append(codes[0])
+        buf.append(n)
+    elif n < 0x10000:
+        buf.append(codes[1])
+        buf.extend(ustruct.pack('>H', n))
+    else:
+        buf.append(codes[2])
+        buf.extend(ustruct.pack('>I', n))
+
+def _msgpack_encode(buf, obj):
+    if obj is None:
+        buf.append(0xc0)
+    elif obj is True:
+        buf.append(0xc3)
+    elif obj is False:
+        buf.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            buf.append(obj)
+        elif -32 <= obj < 0:
+            buf.append(obj & 0xff)
+        elif obj >= 0:
+            if obj < 0x100:
+                buf.append(0xcc)
+                buf.append(obj)
+            elif obj < 0x10000:
+                buf.append(0xcd)
+                buf.extend(ustruct.pack('>H', obj))
+            elif obj < 0x100000000:
+                buf.append(0xce)
+                buf.extend(ustruct.pack('>I', obj))
+            else:
+                buf.append(0xcf)
+                buf.extend(ustruct.pack('>Q', obj))
+        else:
+            if obj >= -0x80:
+                buf.append(0xd0)
+                buf.extend(ustruct.pack('>b', obj))
+            elif obj >= -0x8000:
+                buf.append(0xd1)
+                buf.extend(ustruct.pack('>h', obj))
+            elif obj >= -0x80000000:
+                buf.append(0xd2)
+                buf.extend(ustruct.pack('>i', obj))
+            else:
+                buf.append(0xd3)
+                buf.extend(ustruct.pack('>q', obj))
+    elif isinstance(obj, float):
+        if _is_float32(obj):
+            buf.append(0xca)
+            buf.extend(ustruct.pack('>f', obj))
+        else:
+            buf.append(0xcb)
+            buf.extend(ustruct.pack('>d', obj))
+    elif isinstance(obj, str):
+        data = obj.encode()
+        _msgpack_head(buf, len(data), (0xa0, 32), (0xd9, 0xda, 0xdb))
+        buf.extend(data)
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        _msgpack_head(buf, len(obj), None, (0xc4, 0xc5, 0xc6))
+        buf.extend(obj)
+    elif isinstance(obj, dict):
+        _msgpack_head(buf, len(obj), (0x80, 16), (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _msgpack_encode(buf, key)
+            _msgpack_encode(buf, value)
+    else:
+        # MessagePack の配列は要素数が必要なため、イテレータはリストにしてから出力する
+        if not isinstance(obj, (list, tuple)):
+            obj = list(obj)
+        _msgpack_head(buf, len(obj), (0x90, 16), (None, 0xdc, 0xdd))
+        for value in obj:
+            _msgpack_encode(buf, value)
+
+# 値を MessagePack にする
+# obj: None / bool / int / float / str / bytes / list / tuple / dict / イテレータ(配列として出力)
+def msgpack_dumps(obj):
+    buf = bytearray()
+    _msgpack_encode(buf, obj)
+    return buf
+
+# 先頭バイト -> (struct の書式, バイト数)
+_MSGPACK_NUMBERS = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8),
+}
+# 先頭バイト -> (種類, 長さのバイト数)
+_MSGPACK_SIZED = {
+    0xd9: ('s', 1), 0xda: ('s', 2), 0xdb: ('s', 4),
+    0xc4: ('b', 1), 0xc5: ('b', 2), 0xc6: ('b', 4),
+    0xdc: ('a', 2), 0xdd: ('a', 4),
+    0xde: ('m', 2), 0xdf: ('m', 4),
+}
+_SIZE_FORMATS = {1: '>B', 2: '>H', 4: '>I'}
+
+def _msgpack_decode(data, pos):
+    head = data[pos]
+    pos += 1
+    if head < 0x80:
+        return head, pos
+    if head >= 0xe0:
+        return head - 0x100, pos
+    if head == 0xc0:
+        return None, pos
+    if head == 0xc2:
+        return False, pos
+    if head == 0xc3:
+        return True, pos
+
+    number = _MSGPACK_NUMBERS.get(head, None)
+    if number:
+        return ustruct.unpack_from(number[0], data, pos)[0], pos + number[1]
+
+    if 0xa0 <= head <= 0xbf:
+        kind, n = 's', head & 0x1f
+    elif 0x90 <= head <= 0x9f:
+        kind, n = 'a', head & 0x0f
+    elif 0x80 <= head <= 0x8f:
+        kind, n = 'm', head & 0x0f
+    else:
+        sized = _MSGPACK_SIZED.get(head, None)
+        if sized is None:
+            raise ValueError('msgpack: unsupported type')
+        kind = sized[0]
+        n = ustruct.unpack_from(_SIZE_FORMATS[sized[1]], data, pos)[0]
+        pos += sized[1]
+
+    if kind == 's' or kind == 'b':
+        value = bytes(data[pos:pos + n])
+        return (value.decode() if kind == 's' else value), pos + n
+    if kind == 'a':
+        items = []
+        for _ in range(n):
+            value, pos = _msgpack_decode(data, pos)
+            items.append(value)
+        return items, pos
+    items = {}
+    for _ in range(n):
+        key, pos = _msgpack_decode(data, pos)
+        items[key], pos = _msgpack_decode(data, pos)
+    return items, pos
+
+# MessagePack を値にする
+def msgpack_loads(data):
+    return _msgpack_decode(data, 0)[0]
+
+##-------------------------------------------------------------------------
+## コンテントネゴシエーション
+##-------------------------------------------------------------------------
+
+def _json_dumps(obj):
+    return json_dumps(obj).encode()
+
+def _json_loads(data):
+    return json_loads(data.decode() if isinstance(data, (bytes, bytearray)) else data)
+
+# メディアタイプ -> (dumps, loads)
+CODECS = {
+    MIME_CBOR: (cbor_dumps, cbor_loads),
+    MIME_MSGPACK: (msgpack_dumps, msgpack_loads),
+    'application/x-msgpack': (msgpack_dumps, msgpack_loads),
+    MIME_JSON: (_json_dumps, _json_loads),
+}
+
+# Accept ヘッダから応答に使うメディアタイプを選ぶ
+# q 値は 0 (拒否) のみ考慮し、記述順に最初に対応できるものを選ぶ
+# accept: Accept ヘッダの値
+# return: メディアタイプ (対応するものがない場合は MIME_JSON)
+def negotiate(accept):
+    if not accept:
+        return MIME_JSON
+    for item in accept.split(','):
+        params = item.split(';')
+        mime = params[0].strip().lower()
+        if any(p.strip().replace(' ', '') in ('q=0', 'q=0.0') for p in params[1:]):
+            continue
+        if mime in CODECS:
+            return mime
+    return MIME_JSON
+
+# Content-Type ヘッダから、リクエストの内容を変換する loads を選ぶ
+# return: loads 関数 (対応するものがない場合は JSON)
+def loads_for(content_type):
+    mime = content_type.split(';')[0].strip().lower() if content_type else MIME_JSON
+    return CODECS.get(mime, CODECS[MIME_JSON])[1]
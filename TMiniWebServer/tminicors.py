@@ -0,0 +1,82 @@
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# CORS (Cross-Origin Resource Sharing) の設定
+# プリフライト (OPTIONS) の応答はサーバの開始時に1度だけ組み立て、以降はそのまま送出する
+# Access-Control-Max-Age の間はブラウザがプリフライトを繰り返さない
+class TMiniCors:
+
+    # コンストラクタ
+    # origins    : 許可するオリジン ('*' / オリジンのリスト ex) ['http://192.168.0.2:8080'])
+    # headers    : 許可するリクエストヘッダ
+    # max_age    : プリフライトの結果をブラウザがキャッシュする秒数
+    # credentials: Cookie などの資格情報を許可するかどうか
+    # expose     : JavaScript から参照できるレスポンスヘッダ
+    def __init__(self, origins='*', headers=('content-type', 'authorization'), max_age=600, credentials=False, expose=None):
+        self.origins = origins
+        self.headers = headers
+        self.max_age = max_age
+        self.credentials = credentials
+        self.expose = expose
+        self._preflight = None      # プリフライトの応答 (Access-Control-Allow-Origin と末尾の改行を除く)
+
+    # dict / True / TMiniCors から TMiniCors を作る
+    # config: None の場合は None を返す
+    @classmethod
+    def create(cls, config):
+        if config is None or config is False or isinstance(config, cls):
+            return config or None
+        if config is True:
+            return cls()
+        return cls(**config)
+
+    # プリフライトの応答を組み立てる
+    # methods: 許可するメソッドのリスト (ルートの一覧から作る)
+    def build(self, methods):
+        lines = ['HTTP/1.1 204 No Content',
+                 'access-control-allow-methods: ' + ', '.join(methods),
+                 'access-control-max-age: ' + str(self.max_age)]
+        if self.headers:
+            lines.append('access-control-allow-headers: ' + ', '.join(self.headers))
+        if self.credentials:
+            lines.append('access-control-allow-credentials: true')
+        if self.origins != '*':
+            lines.append('vary: Origin')
+        lines.append('server: TMiniWebServer')
+        lines.append('connection: close')
+        self._preflight = ('\r\n'.join(lines) + '\r\n').encode()
+        LOGGER.debug(f'cors preflight: {self._preflight}')
+
+    # リクエストのオリジンに対して返す Access-Control-Allow-Origin の値
+    # return: 許可しない場合は None
+    def allow_origin(self, origin):
+        if self.origins == '*':
+            # 資格情報を許可する場合は '*' を使えないため、オリジンをそのまま返す
+            return origin if self.credentials else '*'
+        return origin if origin in self.origins else None
+
+    # 通常のリクエストの応答に CORS のヘッダを追加する
+    # return: 許可したかどうか
+    def apply(self, response, origin):
+        allow = self.allow_origin(origin)
+        if allow is None:
+            return False
+        response.add_header('access-control-allow-origin', allow)
+        if self.credentials:
+            response.add_header('access-control-allow-credentials', 'true')
+        if self.expose:
+            response.add_header('access-control-expose-headers', ', '.join(self.expose))
+        if self.origins != '*':
+            response.add_header('vary', 'Origin')
+        return True
+
+    # プリフライトに応答する
+    # return: 許可したかどうか (許可しない場合は何も送出しない)
+    async def write_preflight(self, response, origin):
+        allow = self.allow_origin(origin)
+        if allow is None:
+            return False
+        response._writer.write(self._preflight)
+        await response._drain(f'access-control-allow-origin: {allow}\r\n\r\n')
+        return True
@@ -0,0 +1,153 @@
+import uasyncio as asyncio
+from time import ticks_ms
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# 送信キューが満杯の購読者への動作
+SLOW_SKIP = 'skip'      # その購読者にはメッセージを送らない
+SLOW_EVICT = 'evict'    # 購読を解除して切断する (ストリームも閉じ、受信を待っているハンドラを起こす)
+
+# トピック毎の配信ハブ (pub/sub)
+# publish されたデータは接続の種類毎に1度だけフレーム化し、同じバッファを全購読者の送信キューへ積む
+# また、接続中の全ての接続の死活確認を1つのタスクで行う
+class TMiniHub:
+
+    # コンストラクタ
+    # slow_policy: 送信キューが満杯の購読者への動作 (SLOW_XXX)
+    def __init__(self, slow_policy=SLOW_SKIP):
+        self.slow_policy = slow_policy
+        self._topics = {}   # topic -> 購読している接続のリスト
+        self._conns = []    # 死活確認の対象となる接続のリスト
+        self._keepalive_task = None
+        self._history = {}  # topic -> 再送用に保持する (id, data, event) のリスト
+        self.history_size = 0   # トピック毎に保持するイベント数 (Last-Event-ID での再送用)
+        self.ping_ms = 0
+        self.pong_ms = 0
+        self.idle_ms = 0
+        self.heartbeat_ms = 0
+
+    # 接続を登録する (接続時)
+    def attach(self, conn):
+        self._conns.append(conn)
+
+    # トピックを購読する
+    # topic: トピック名
+    # conn : TMiniWebSocket など送信キューを持つ接続
+    def subscribe(self, topic, conn):
+        subs = self._topics.setdefault(topic, [])
+        if conn not in subs:
+            subs.append(conn)
+        LOGGER.debug(f'subscribe: {topic} ({len(subs)})')
+
+    # トピックの購読を解除する
+    def unsubscribe(self, topic, conn):
+        subs = self._topics.get(topic, None)
+        if subs and conn in subs:
+            subs.remove(conn)
+            if not subs:
+                del self._topics[topic]
+
+    # 接続が購読している全てのトピックを解除し、登録を削除する (切断時)
+    def detach(self, conn):
+        for topic in list(self._topics):
+            self.unsubscribe(topic, conn)
+        if conn in self._conns:
+            self._conns.remove(conn)
+
+    # 接続数
+    def connections(self):
+        return len(self._conns)
+
+    # 死活確認のスケジューラを開始する
+    # ping_interval: 受信が途絶えてから PING を送るまでの秒数 (0: 送らない)
+    # pong_timeout : PING を送ってから PONG を待つ秒数
+    # idle_timeout : データを送受信しないまま切断するまでの秒数 (0: 切断しない)
+    # heartbeat    : Server-Sent Events で送信が途絶えてからコメントを送るまでの秒数 (0: 送らない)
+    def start_keepalive(self, ping_interval, pong_timeout, idle_timeout=0, heartbeat=0):
+        self.stop_keepalive()
+        self.ping_ms = ping_interval * 1000
+        self.pong_ms = pong_timeout * 1000
+        self.idle_ms = idle_timeout * 1000
+        self.heartbeat_ms = heartbeat * 1000
+        periods = [t for t in (self.ping_ms, self.pong_ms, self.idle_ms, self.heartbeat_ms) if t]
+        if not (self.ping_ms or self.idle_ms or self.heartbeat_ms):
+            return
+        self._keepalive_task = asyncio.create_task(self._keepalive_proc(max(500, min(periods) // 2)))
+
+    # 死活確認のスケジューラを停止する
+    def stop_keepalive(self):
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+
+    # 死活確認のスケジューラ
+    # 接続毎にタイマーを持たず、1つのタスクで全ての接続を巡回する
+    # 各接続の _keepalive(now, hub) が、このハブの設定値(ping_ms など)を見て処理する
+    async def _keepalive_proc(self, tick_ms):
+        while True:
+            await asyncio.sleep_ms(tick_ms)
+            now = ticks_ms()
+            for conn in list(self._conns):
+                try:
+                    conn._keepalive(now, self)
+                except Exception as ex:
+                    LOGGER.error(f'keepalive: {ex}')
+
+    # トピックの購読者数
+    def subscribers(self, topic):
+        return len(self._topics.get(topic, ()))
+
+    # 保持しているイベントのうち、指定された id より後のものを返す
+    # last_id: Last-Event-ID (文字列として比較する). 見つからない場合は保持している全てのイベントを返す
+    def history(self, topic, last_id=None):
+        events = self._history.get(topic, [])
+        last_id = str(last_id)
+        for i, item in enumerate(events):
+            if str(item[0]) == last_id:
+                return events[i + 1:]
+        return events
+
+    # トピックにデータを配信する
+    # topic: トピック名
+    # data : 送信データ (str or bytes)
+    # event: Server-Sent Events のイベント名 (WebSocket では無視)
+    # id   : Server-Sent Events のイベントID (WebSocket では無視)
+    # return: 送信キューに積んだ購読者数
+    def publish(self, topic, data, event=None, id=None):
+        if id is not None and self.history_size:
+            events = self._history.setdefault(topic, [])
+            events.append((id, data, event))
+            if len(events) > self.history_size:
+                events.pop(0)
+
+        subs = self._topics.get(topic, None)
+        if not subs:
+            return 0
+
+        frames = {}     # 接続の種類 -> フレーム化済みのバッファ
+        count = 0
+        for conn in list(subs):
+            if conn.is_closed():
+                self.unsubscribe(topic, conn)
+                continue
+
+            queue = conn._send_queue
+            if queue.is_full():
+                # 遅い購読者のために他の購読者を待たせない
+                if self.slow_policy == SLOW_EVICT:
+                    LOGGER.info(f'evict slow subscriber: {topic}')
+                    self.detach(conn)
+                    conn._evict()
+                else:
+                    queue.dropped_frames += 1
+                continue
+
+            kind = conn._hub_kind()
+            frame = frames.get(kind, None)
+            if frame is None:
+                frame = frames[kind] = conn._hub_frame(data, event, id)
+            if queue.offer(frame):
+                queue.kick()
+                count += 1
+        return count
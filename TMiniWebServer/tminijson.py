@@ -0,0 +1,96 @@
+from json import dumps
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+_SCALAR_TYPES = (str, int, float, bool)
+_BYTES_TYPES = (bytes, bytearray, memoryview)   # 反復できるが配列にはしない (json.dumps と同じく TypeError)
+
+# 配列として出力するイテレータかどうか (dict / list / tuple / 文字列 / バイト列以外の反復できる値)
+def _is_iterator(obj):
+    if isinstance(obj, _SCALAR_TYPES) or isinstance(obj, _BYTES_TYPES) or isinstance(obj, (dict, list, tuple)) or obj is None:
+        return False
+    try:
+        iter(obj)
+        return True
+    except TypeError:
+        return False
+
+# 値にイテレータ (ジェネレータや非同期イテレータなど、dict / list / tuple 以外の反復できる値) を含むかどうか
+# 含まない値は json.dumps で1度に変換できる
+def has_iterator(obj):
+    if isinstance(obj, dict):
+        for value in obj.values():
+            if has_iterator(value):
+                return True
+        return False
+    if isinstance(obj, (list, tuple)):
+        for value in obj:
+            if has_iterator(value):
+                return True
+        return False
+    return hasattr(obj, '__aiter__') or _is_iterator(obj)
+
+# 値を JSON の文字列の断片に分けて順に返すジェネレータ
+# オブジェクト全体を1つの文字列にしないため、大きな配列でもメモリを一定に保てる
+# obj: dict / list / tuple / イテレータ(ジェネレータなど、配列として出力) / その他 json.dumps できる値
+def iterencode(obj):
+    if isinstance(obj, dict):
+        yield '{'
+        first = True
+        for key, value in obj.items():
+            if not first:
+                yield ','
+            first = False
+            yield dumps(str(key))
+            yield ':'
+            yield from iterencode(value)
+        yield '}'
+    elif isinstance(obj, (list, tuple)) or _is_iterator(obj):
+        # list / tuple / イテレータは配列として出力する
+        yield '['
+        first = True
+        for value in obj:
+            if not first:
+                yield ','
+            first = False
+            yield from iterencode(value)
+        yield ']'
+    else:
+        yield dumps(obj)
+
+# 値を JSON にして書き出す
+# writer: await writer.write(str) できるストリーム (_ChunkWriter など)
+# obj   : iterencode で扱える値. 非同期イテレータ (async ジェネレータなど) はどの深さにあっても配列として出力する
+async def dump_async(obj, writer):
+    if isinstance(obj, dict):
+        await writer.write('{')
+        first = True
+        for key, value in obj.items():
+            if not first:
+                await writer.write(',')
+            first = False
+            await writer.write(dumps(str(key)))
+            await writer.write(':')
+            await dump_async(value, writer)
+        await writer.write('}')
+    elif hasattr(obj, '__aiter__'):
+        await writer.write('[')
+        first = True
+        async for value in obj:
+            if not first:
+                await writer.write(',')
+            first = False
+            await dump_async(value, writer)
+        await writer.write(']')
+    elif isinstance(obj, (list, tuple)) or _is_iterator(obj):
+        await writer.write('[')
+        first = True
+        for value in obj:
+            if not first:
+                await writer.write(',')
+            first = False
+            await dump_async(value, writer)
+        await writer.write(']')
+    else:
+        await writer.write(dumps(obj))
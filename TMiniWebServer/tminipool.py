@@ -0,0 +1,82 @@
+import uasyncio as asyncio
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# 優先度クラス
+PRIORITY_HIGH = 'high'              # 操作パネルなど、待たせたくないルート
+PRIORITY_API = 'api'                # 通常のルート
+PRIORITY_STATIC = 'static'          # 静的ファイル
+PRIORITY_WEBSOCKET = 'websocket'    # WebSocket の接続
+
+# 優先度クラス毎に同時に処理する接続数の既定値 (0: 制限しない)
+# Server-Sent Events や WebSocket のハンドラは接続が続く間プールを使い続けるため、既定では制限せず、
+# 制限する場合は TMiniWebServer(pools=...) で上限を指定する
+DEFAULT_POOLS = {
+    PRIORITY_HIGH: 0,
+    PRIORITY_API: 0,
+    PRIORITY_STATIC: 0,
+    PRIORITY_WEBSOCKET: 0,
+}
+
+# 同時に処理する接続数を制限するプール
+# 優先度クラス毎に別のプールを使うため、大きな静的ファイルの送信が続いても他のクラスの処理は待たされない
+#   async with pool:
+#       ## 処理
+class TMiniPool:
+
+    # コンストラクタ
+    # name : 優先度クラスの名前
+    # limit: 同時に処理する数の上限 (0: 制限しない)
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.active = 0         # 処理中の数
+        self.waiting = 0        # 空きを待っている数
+        self.rejected = 0       # 空きがなく断った数 (try_acquire)
+        self._released = None   # 空きができたことを通知する Event
+
+    # 空きがあれば確保する (待たない)
+    # return: True: 確保した / False: 空きがない
+    def try_acquire(self):
+        if self.limit and self.active >= self.limit:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    # 空きができるまで待って確保する
+    async def acquire(self):
+        while self.limit and self.active >= self.limit:
+            if self._released is None:
+                self._released = asyncio.Event()
+            self.waiting += 1
+            try:
+                self._released.clear()
+                await self._released.wait()
+            finally:
+                self.waiting -= 1
+        self.active += 1
+
+    # 確保したものを解放する
+    def release(self):
+        self.active -= 1
+        if self._released is not None and self.waiting:
+            self._released.set()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    # 統計情報
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,74 @@
+from time import ticks_ms, ticks_diff
+from ucollections import OrderedDict
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# トークンの単位 (1リクエスト = _COST). 浮動小数点を使わないよう、トークンを整数で扱う
+_COST = 1000000
+
+# クライアント毎のトークンバケットによるリクエスト数の制限
+# クライアントの状態は table_size 件までの表に保持し、超えた場合は最も使われていないものから破棄する (LRU)
+# (破棄されたクライアントは、次のリクエストでバケットが満杯の状態から始まる)
+class TMiniRateLimiter:
+    table_size = 32     # 状態を保持するクライアント数の上限
+
+    # コンストラクタ
+    # rate : 1秒あたりに補充するトークン数 (= 継続して受け付ける 1秒あたりのリクエスト数. 0.5 なども可)
+    # burst: バケットの容量 (= 連続して受け付けるリクエスト数). 省略時は rate (最低 1)
+    def __init__(self, rate, burst=None):
+        if burst is None:
+            burst = max(1, int(rate))
+        self.rate = rate
+        self.burst = burst
+        self._per_ms = max(1, int(rate * _COST / 1000))     # 1ms あたりに補充するトークン
+        self._capacity = int(burst) * _COST
+        self._fill_ms = self._capacity // self._per_ms + 1  # 空のバケットが満杯になるまでの時間
+        self._table = OrderedDict()     # key -> [トークン, 最後に補充した時刻]
+        self.rejected = 0               # 制限したリクエスト数
+
+    # (rate, burst) のタプル / TMiniRateLimiter から TMiniRateLimiter を作る
+    # config: None の場合は None を返す
+    @classmethod
+    def create(cls, config):
+        if config is None or isinstance(config, cls):
+            return config
+        if isinstance(config, (tuple, list)):
+            return cls(*config)
+        return cls(config)
+
+    # リクエストを1つ受け付けられるか調べ、受け付ける場合はトークンを1つ消費する
+    # key: クライアントを識別するキー (IPアドレス)
+    # return: 0: 受け付ける / それ以外: 次に受け付けられるまでの秒数 (Retry-After)
+    def take(self, key):
+        now = ticks_ms()
+        entry = self._table.pop(key, None)
+        if entry is None:
+            if len(self._table) >= self.table_size:
+                self._table.pop(next(iter(self._table)))
+            entry = [self._capacity, now]
+        else:
+            elapsed = min(ticks_diff(now, entry[1]), self._fill_ms)
+            if elapsed > 0:
+                entry[0] = min(self._capacity, entry[0] + elapsed * self._per_ms)
+                entry[1] = now
+        # 最近使ったものとして末尾に移す
+        self._table[key] = entry
+
+        if entry[0] >= _COST:
+            entry[0] -= _COST
+            return 0
+        self.rejected += 1
+        wait_ms = (_COST - entry[0] + self._per_ms - 1) // self._per_ms
+        return (wait_ms + 999) // 1000
+
+    # 全てのクライアントの状態を破棄する
+    def reset(self):
+        self._table = OrderedDict()
+
+    # 統計情報
+    def stats(self):
+        return {
+            'clients': len(self._table),
+            'rejected': self.rejected,
+        }
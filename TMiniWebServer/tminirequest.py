@@ -19,8 +19,11 @@ class TMiniRequest:
         self._content_type = None
         self._content_length = 0
         self._form_params = { }
+        self._remote_addr = None    # クライアントのIPアドレス
 
-    async def parse(self):
+    # リクエストを解析する
+    # read_body: False の場合はヘッダまでを解析し、内容は読み込まない (後で parse_body を呼び出す)
+    async def parse(self, read_body=True):
         # ヘッダのリクエストラインを解析
         if not await self._parse():
             return False, HttpStatusCode.INTERNAL_SERVER_ERROR
@@ -29,11 +32,15 @@ class TMiniRequest:
         if not await self._parse_header():
             return False, HttpStatusCode.BAD_REQUEST
 
-        # フォームパラメータの解析
-        await self._parse_form_params()
+        if read_body:
+            await self.parse_body()
 
         return True, None
 
+    # リクエストの内容を解析する (フォームパラメータ)
+    async def parse_body(self):
+        await self._parse_form_params()
+
     # リクエスト内容の解析
     # _query_string と _query_params に格納する
     async def _parse(self):
@@ -80,10 +87,14 @@ class TMiniRequest:
                 self._headers[elements[0].strip().lower()] = elements[1].strip()
                 LOGGER.debug(f"header:{elements[0].strip().lower()}={elements[1].strip()}")
             # コンテンツ前の改行
+            # 内容の長さと種類は、メソッドによらず (PATCH・DELETE なども) 取得する
             elif len(elements) == 1 and len(elements[0]) == 0:
-                if self._method == 'POST' or self._method == 'PUT':
-                    self._content_type = self._headers.get("content-type", None)
+                self._content_type = self._headers.get("content-type", None)
+                try:
                     self._content_length = (int)(self._headers.get('content-length', 0))
+                except ValueError:
+                    LOGGER.info(f"_parse_header warning: content-length {self._headers.get('content-length')}")
+                    return False
 
                 return True
             else:
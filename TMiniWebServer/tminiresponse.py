@@ -1,17 +1,118 @@
 import sys
 import gc
+import uasyncio as asyncio
 from . import logging
 from .tminiwebserver_util import TMiniWebServerUtil, HttpStatusCode
 
 LOGGER = logging.getLogger(__name__)
 
+# text/* 以外で charset を付けるメディアタイプ
+_CHARSET_TYPES = ('application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+# 静的ファイルが見つからない場合の応答 (毎回組み立てないよう、あらかじめ作っておく)
+# write_error_response(NOT_FOUND) と同じ内容
+_NOT_FOUND_RESPONSE = (b'HTTP/1.1 404 Not Found\r\n'
+                       b'server: TMiniWebServer\r\n'
+                       b'connection: close\r\n'
+                       b'content-type: text/html; charset=UTF-8\r\n'
+                       b'content-length: 9\r\n'
+                       b'\r\n'
+                       b'Not Found')
+
+# ストリーミング出力用のバッファ付きライタ
+# 小さな書き込みを固定長のバッファにまとめ、満杯になったら drain する
+class _ChunkWriter:
+
+    # コンストラクタ
+    # response  : TMiniResponse
+    # chunk_size: バッファのサイズ
+    def __init__(self, response, chunk_size):
+        self._response = response
+        self._buf = bytearray(chunk_size)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+
+    # データを書き込む
+    # data: str or bytes
+    async def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if self._len + n > len(self._buf):
+            await self.flush()
+        if n >= len(self._buf):
+            await self._response._drain(data)
+            return
+        self._mv[self._len:self._len + n] = data
+        self._len += n
+
+    # バッファのデータを送出する
+    async def flush(self):
+        if self._len:
+            await self._response._drain(self._mv[:self._len])
+            self._len = 0
+
+    async def close(self):
+        await self.flush()
+
+# HEAD リクエスト用の書き出しストリーム
+# ヘッダの終わり (空行) までを送出し、以降の内容は捨てる
+class _HeadWriter:
+    def __init__(self, writer):
+        self._writer = writer
+        self._tail = b''        # 直前に書き込んだ末尾 (空行が書き込みをまたぐ場合のため)
+        self._done = False
+
+    def write(self, data):
+        if self._done:
+            return
+        data = data.encode() if isinstance(data, str) else bytes(data)
+        n = len(self._tail)
+        i = (self._tail + data).find(b'\r\n\r\n')
+        if i >= 0:
+            self._done = True
+            data = data[:i + 4 - n]
+        else:
+            self._tail = (self._tail + data)[-3:]
+        self._writer.write(data)
+
+    async def drain(self):
+        await self._writer.drain()
+
+    def close(self):
+        self._writer.close()
+
+    async def wait_closed(self):
+        await self._writer.wait_closed()
+
+    def get_extra_info(self, name):
+        return self._writer.get_extra_info(name)
+
 class TMiniResponse:
+    stream_chunk_size = 1024    # ストリーミング出力でまとめて送出するバイト数
+    file_chunk_size = 4 * 1024  # ファイルを1度に送出するバイト数
+    yield_per_chunk = True      # ファイルを送出する度に他のタスクに処理を譲る (大きなファイルの送信中も他の接続を待たせない)
 
     # コンストラクタ
     # writer: クライアントへの書き出しストリーム？
     # server: TMiniWebServerインスタンス
     def __init__(self, writer):
         self._writer = writer
+        self._extra_headers = None  # add_header で追加したヘッダ
+        self.head_only = False      # HEAD リクエストへの応答 (ヘッダのみ送出する)
+
+    # HEAD リクエストに応答するため、以降はヘッダのみ送出する
+    # ファイルは内容を読み込まず、ハンドラの出力した内容は捨てる
+    def set_head_only(self):
+        if not self.head_only:
+            self.head_only = True
+            self._writer = _HeadWriter(self._writer)
+
+    # 応答に追加するヘッダを登録する (ミドルウェアなどから、ハンドラが応答する前に登録する)
+    def add_header(self, name, value):
+        if self._extra_headers is None:
+            self._extra_headers = {}
+        self._extra_headers[name] = value
 
     # クライアントへ応答する
     # content: HTTPの内容
@@ -39,6 +140,29 @@ class TMiniResponse:
             pass
         LOGGER.debug('[out] write_response')
 
+    # 内容の長さが分からないレスポンスを開始する
+    # content-length は出力せず、切断で内容の終わりを示す
+    # return: 内容を書き込む _ChunkWriter (最後に close() すること)
+    async def begin_stream(self, headers={}, http_status = HttpStatusCode.OK, content_type="text/html", content_charset='UTF-8'):
+        self._write_status_code(http_status)
+        self._write_headers(headers, content_type, content_charset, None)
+        await self._drain()
+        return _ChunkWriter(self, self.stream_chunk_size)
+
+    # 内容を少しずつ生成しながら応答する
+    # chunks: str or bytes を返すイテレータ (ジェネレータなど)
+    # 生成された内容は stream_chunk_size 毎にまとめて送出するため、内容全体をメモリに持たない
+    async def write_response_stream(self, chunks, headers={}, http_status = HttpStatusCode.OK, content_type="text/html", content_charset='UTF-8'):
+        LOGGER.debug('[in] write_response_stream')
+        try:
+            writer = await self.begin_stream(headers, http_status, content_type, content_charset)
+            for chunk in chunks:
+                await writer.write(chunk)
+            await writer.close()
+        except Exception as ex:
+            sys.print_exception(ex)
+        LOGGER.debug('[out] write_response_stream')
+
     # クライアントへファイルの内容を返す
     # file_phys_path: ファイルのパス
     # headers: HTTPのヘッダ
@@ -67,12 +191,14 @@ class TMiniResponse:
             await self._drain()
 
             # 内容の書き込み
-            if content_length > 0:
+            if content_length > 0 and not self.head_only:
                 with open(file_phys_path, 'rb') as f:
                     while True:
-                        data = f.read(4*1024)
+                        data = f.read(self.file_chunk_size)
                         if len(data) > 0:
                             await self._drain(data)
+                            if self.yield_per_chunk:
+                                await asyncio.sleep(0)
                         else:
                             break
 
@@ -82,6 +208,42 @@ class TMiniResponse:
 
         LOGGER.debug('[out] write_response_from_file')
 
+    # 静的ファイルの提供元 (TMiniAssetProvider) のファイルを返す
+    # If-None-Match が ETag と一致する場合は内容を送らずに NOT_MODIFIED を返す
+    # provider: TMiniAssetProvider
+    # entry   : provider.find() で取得したファイルの情報
+    # if_none_match: リクエストの If-None-Match ヘッダ
+    async def write_response_from_asset(self, provider, entry, if_none_match=None, headers={}):
+        LOGGER.debug('[in] write_response_from_asset')
+        try:
+            _, size, mime, etag, gzip = entry
+            headers = dict(headers)
+            headers['etag'] = etag
+            if gzip:
+                # Accept-Encoding によって返す内容が変わるため、共有キャッシュに区別させる
+                headers['vary'] = 'Accept-Encoding'
+            if if_none_match and etag in if_none_match:
+                self._write_status_code(HttpStatusCode.NOT_MODIFIED)
+                self._write_headers(headers, None, None, 0)
+                await self._drain()
+                return
+
+            if gzip:
+                headers['content-encoding'] = 'gzip'
+            charset = 'UTF-8' if mime.startswith('text/') or mime in _CHARSET_TYPES else None
+            self._write_status_code(HttpStatusCode.OK)
+            self._write_headers(headers, mime, charset, size)
+            await self._drain()
+            if self.head_only:
+                return
+            for chunk in provider.chunks(entry):
+                await self._drain(chunk)
+                if self.yield_per_chunk:
+                    await asyncio.sleep(0)
+        except Exception as ex:
+            sys.print_exception(ex)
+        LOGGER.debug('[out] write_response_from_asset')
+
     # エラーを返す
     # code: HTTPステータスコード
     # content: 指定しない場合は、エラー簡易メッセージを表示
@@ -92,6 +254,18 @@ class TMiniResponse:
         await self.write_response(http_status=code, content=content)
         return False
 
+    # Expect: 100-continue に対して、内容を送ってよいことを通知する (この後に通常の応答を返す)
+    async def write_continue(self):
+        self._write_status_code(HttpStatusCode.CONTINUE)
+        await self._drain('\r\n')
+
+    # 404 を返す (追加するヘッダがなければ、組み立て済みの応答をそのまま送出する)
+    async def write_not_found(self):
+        if self._extra_headers:
+            await self.write_error_response(HttpStatusCode.NOT_FOUND)
+            return
+        await self._drain(_NOT_FOUND_RESPONSE)
+
     async def write_bad_request(self):
         await self.write_error_response(HttpStatusCode.BAD_REQUEST)
 
@@ -103,12 +277,19 @@ class TMiniResponse:
         self._writer.write(data)
 
     # ヘッダの出力
+    # content_length: None の場合は長さが分からない内容として content-length を出力しない
     def _write_headers(self, headers, content_type, content_charset, content_length):
         if isinstance(headers, dict):
-            map(lambda x: self._write_header(x[0], x[1]), headers.items())
+            for name, value in headers.items():
+                self._write_header(name, value)
+        if self._extra_headers:
+            for name, value in self._extra_headers.items():
+                self._write_header(name, value)
         self._write_header("server", "TMiniWebServer")
         self._write_header("connection", "close")
-        if content_length > 0:
+        if content_length is None:
+            self._write_content_type_header(content_type, content_charset)
+        elif content_length > 0:
             self._write_content_type_header(content_type, content_charset)
             self._write_header('content-length', content_length)
         self._writer.write("\r\n")
@@ -132,6 +313,17 @@ class TMiniResponse:
             self._writer.write(predata)
         await self._writer.drain()
 
+    # キャッシュした応答 (ステータス行・ハンドラのヘッダ・内容) を送出する
+    # add_header で追加したヘッダはステータス行の直後に書き込む
+    async def _drain_cached(self, data):
+        if self._extra_headers:
+            i = data.find(b'\r\n') + 2
+            self._writer.write(data[:i])
+            for name, value in self._extra_headers.items():
+                self._write_header(name, value)
+            data = memoryview(data)[i:]
+        await self._drain(data)
+
     # クライアントと切断する
     async def close(self):
         try:
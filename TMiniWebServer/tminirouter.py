@@ -1,7 +1,9 @@
-from json import dumps, loads
+from json import loads, dumps
 
 from . import logging
-from .tminiwebserver_util import TMiniWebServerUtil
+
+# tminijson / tminicodec / tminitemplate / tminisse は使うメソッドの中で読み込む
+# (使わないアプリケーションではモジュールを読み込まず、その分の RAM を使わない)
 
 LOGGER = logging.getLogger(__name__)
 
@@ -9,7 +11,9 @@ LOGGER = logging.getLogger(__name__)
 class TMiniRouter:
 
     # コンストラクタ
-    def __init__(self, req, res, route_args):
+    # server: TMiniWebServerインスタンス
+    def __init__(self, req, res, route_args, server=None):
+        self.server = server
         self.request = req
         self.response = res
         self.route_params = route_args
@@ -26,13 +30,73 @@ class TMiniRouter:
         return None
 
     # json形式のリクエストを書き込む
+    # data: JSON の文字列 / dict や list などの値 / イテレータや非同期イテレータ (配列として出力)
+    # 通常の値は json.dumps で変換して content-length 付きで返す
+    # イテレータを含む場合は JSON 全体を文字列にせず、変換しながら stream_chunk_size 毎に送出する
+    # (送出を始めた後に変換に失敗した場合は、途中までの内容で切断する)
     async def write_json(self, data):
-        if not isinstance(data, str):
-            data = dumps(data)
-        await self.response.write_response(content = data, content_type = "application/json")
+        if isinstance(data, str):
+            await self.response.write_response(content = data, content_type = "application/json")
+            return
+        from .tminijson import dump_async, has_iterator
+        if not has_iterator(data):
+            await self.response.write_response(content = dumps(data), content_type = "application/json")
+            return
+        try:
+            writer = await self.response.begin_stream(content_type = "application/json")
+            await dump_async(data, writer)
+            await writer.close()
+        except Exception as ex:
+            LOGGER.error(ex)
+
+    # リクエストの内容を Content-Type に応じて変換して取得する
+    # application/cbor / application/msgpack / それ以外は JSON として扱う
+    async def read_data(self):
+        from .tminicodec import loads_for
+        try:
+            data = await self.request.read_content()
+            return loads_for(self.request._content_type)(data)
+        except:
+            pass
+        return None
+
+    # Accept ヘッダに応じた形式でデータを書き込む
+    # application/cbor / application/msgpack を受け付ける場合はバイナリで、それ以外は JSON で応答する
+    # data: dict や list などの値
+    async def write_data(self, data):
+        from .tminicodec import CODECS, MIME_JSON, negotiate
+        mime = negotiate(self.request._headers.get('accept', None))
+        if mime == MIME_JSON:
+            await self.write_json(data)
+            return
+        await self.response.write_response(CODECS[mime][0](data), content_type=mime, content_charset=None)
 
     # データを書き込む
     async def write(self, content, **args):
         keys = ["headers", "http_status", "content_type", "content_charset"]
         args = dict(filter(lambda item: item[0] in keys, args.items()))
         await self.response.write_response(content, **args)
+
+    # テンプレートを出力する
+    # テンプレートは内容全体をメモリに持たず、チャンク単位で送出する
+    # name: TMiniTemplate.template_dir からの相対パス
+    # args: テンプレートの引数 ({% args %} で指定した順)
+    async def write_template(self, name, *args, **kwargs):
+        keys = ["headers", "http_status", "content_type", "content_charset"]
+        kwargs = dict(filter(lambda item: item[0] in keys, kwargs.items()))
+        from .tminitemplate import TMiniTemplate
+        await self.response.write_response_stream(TMiniTemplate.render(name, *args), **kwargs)
+
+    # 時間のかかる処理(ファイルのハッシュ計算やセンサーの読み込みなど)をワーカースレッドで実行し、完了を待つ
+    # 待っている間もイベントループは止まらず、他の接続を処理できる
+    # func: 実行する関数 (async 関数は不可. uasyncio のオブジェクトを操作しないこと)
+    # return: 関数の戻り値
+    async def run_in_worker(self, func, *args):
+        return await self.server.worker.run(func, *args)
+
+    # Server-Sent Events の応答を開始する
+    # async with router.event_stream() as es:
+    #     await es.send(data, event='update', id=1)
+    def event_stream(self):
+        from .tminisse import TMiniEventStream
+        return TMiniEventStream(self)
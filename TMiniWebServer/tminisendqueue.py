@@ -0,0 +1,153 @@
+import uasyncio as asyncio
+from time import ticks_ms
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# キューが満杯の場合の動作
+OVERFLOW_BLOCK = 'block'              # 空きができるまで送信側を待たせる
+OVERFLOW_DROP_OLDEST = 'drop_oldest'  # 最も古い未送信フレームを破棄する
+OVERFLOW_CLOSE = 'close'              # 接続を閉じる
+
+# 接続毎の送信キュー
+# フレーム(バッファのタプル)を溜め、1つのタスクだけが書き込みと drain を行う
+class TMiniSendQueue:
+
+    # コンストラクタ
+    # writer    : クライアントへの書き出しストリーム
+    # max_frames: キューに溜められる最大フレーム数(ハイウォーターマーク)
+    # overflow  : キューが満杯の場合の動作 (OVERFLOW_XXX)
+    # on_close  : OVERFLOW_CLOSE で閉じる場合に呼び出す関数
+    def __init__(self, writer, max_frames=8, overflow=OVERFLOW_BLOCK, on_close=None):
+        self._writer = writer
+        self._frames = []
+        self._flushing = False
+        self._space = asyncio.Event()
+        self._on_close = on_close
+        self.max_frames = max_frames
+        self.overflow = overflow
+        self.closed = False
+        self.dropped_frames = 0     # 破棄したフレーム数
+        self.sent_frames = 0        # 送信したフレーム数
+        self.sent_bytes = 0         # 送信したバイト数
+        self.drain_since = None     # drain を始めた時刻 (drain 中でない場合は None). 送信が詰まっていないかの確認に使う
+
+    # 未送信のフレーム数
+    def depth(self):
+        return len(self._frames)
+
+    # キューが満杯かどうか
+    def is_full(self):
+        return len(self._frames) >= self.max_frames
+
+    # 待たずにフレームを追加する
+    # frame: 書き込むバッファのタプル ex) (header, payload)
+    # return: 追加できたかどうか (OVERFLOW_BLOCK で満杯の場合は False)
+    def offer(self, frame):
+        if self.closed:
+            return False
+        if self.is_full():
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._frames.pop(0)
+                self.dropped_frames += 1
+            elif self.overflow == OVERFLOW_CLOSE:
+                LOGGER.info('send queue overflow. closing.')
+                self.dropped_frames += 1
+                self.close()
+                return False
+            else:
+                return False
+        self._frames.append(frame)
+        return True
+
+    # フレームを追加して送出する
+    # OVERFLOW_BLOCK の場合は、キューに空きができるまで待つ
+    # return: 追加できたかどうか
+    async def put(self, frame):
+        while self.overflow == OVERFLOW_BLOCK and self.is_full() and not self.closed:
+            self._space.clear()
+            await self._space.wait()
+        if not self.offer(frame):
+            return False
+        await self.flush()
+        return True
+
+    # キューのフレームを書き込んで drain する
+    # 既に別のタスクが送出中の場合は、そのタスクに任せてすぐに戻る
+    async def flush(self):
+        if self._flushing:
+            return
+        self._flushing = True
+        try:
+            while self._frames and not self.closed:
+                frame = self._frames.pop(0)
+                for buf in frame:
+                    self._writer.write(buf)
+                    self.sent_bytes += len(buf)     # フレームは1バイト単位のバッファ (payload_of で確認済み)
+                self.sent_frames += 1
+                self._space.set()
+                self.drain_since = ticks_ms()
+                await self._writer.drain()
+                self.drain_since = None
+        except Exception as ex:
+            LOGGER.debug(f'send queue flush failed. ({ex})')
+            self.closed = True
+            self.dropped_frames += len(self._frames)
+            self._frames = []
+        finally:
+            self.drain_since = None
+            self._flushing = False
+            self._space.set()
+
+    # キューを経由せずにバッファを書き込んで drain する
+    # キューに溜まっているフレームを先に送出してから書き込むため、送信順は保たれる
+    # 書き込み後はバッファを参照しないため、戻った後に呼び出し側がバッファを再利用できる
+    # return: 書き込めたかどうか
+    async def write_now(self, buf):
+        while (self._frames or self._flushing) and not self.closed:
+            self._space.clear()
+            await self._space.wait()
+        if self.closed:
+            return False
+        self._flushing = True
+        try:
+            self._writer.write(buf)
+            self.sent_bytes += len(buf)
+            self.sent_frames += 1
+            self.drain_since = ticks_ms()
+            await self._writer.drain()
+            return True
+        except Exception as ex:
+            LOGGER.debug(f'send queue write failed. ({ex})')
+            self.closed = True
+            return False
+        finally:
+            self.drain_since = None
+            self._flushing = False
+            self._space.set()
+            self.kick()
+
+    # 送出中のタスクがなければ、バックグラウンドで送出を開始する
+    def kick(self):
+        if self._frames and not self._flushing and not self.closed:
+            asyncio.create_task(self.flush())
+
+    # キューを閉じる (未送信のフレームは破棄する)
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.dropped_frames += len(self._frames)
+        self._frames = []
+        self._space.set()
+        if self._on_close:
+            self._on_close()
+
+    # 統計情報
+    def stats(self):
+        return {
+            'queue_depth': len(self._frames),
+            'dropped_frames': self.dropped_frames,
+            'sent_frames': self.sent_frames,
+            'sent_bytes': self.sent_bytes,
+        }
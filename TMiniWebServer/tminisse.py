@@ -0,0 +1,136 @@
+from json import dumps
+from time import ticks_ms, ticks_diff
+from . import logging
+from .tminiwebserver_util import HttpStatusCode
+from .tminisendqueue import TMiniSendQueue, OVERFLOW_DROP_OLDEST
+
+LOGGER = logging.getLogger(__name__)
+
+_HEARTBEAT = b':\n\n'
+
+# Server-Sent Events のイベントをバイト列にする
+# data : 送信データ (str 以外は JSON にする)
+# event: イベント名
+# id   : イベントID (クライアントは再接続時に Last-Event-ID ヘッダで送ってくる)
+# retry: 再接続までのミリ秒
+def encode_event(data, event=None, id=None, retry=None):
+    if isinstance(data, bytes):
+        data = data.decode()
+    elif not isinstance(data, str):
+        data = dumps(data)
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}\n')
+    if event:
+        lines.append(f'event: {event}\n')
+    if retry:
+        lines.append(f'retry: {retry}\n')
+    for line in data.split('\n'):
+        lines.append(f'data: {line}\n')
+    lines.append('\n')
+    return ''.join(lines).encode()
+
+# Server-Sent Events の応答
+# async with router.event_stream() as es:
+#     await es.send(data, event='update', id=1)
+class TMiniEventStream:
+    send_queue_size = 8                 # 送信キューに溜められる最大イベント数
+    send_overflow = OVERFLOW_DROP_OLDEST    # 送信キューが満杯の場合の動作 (OVERFLOW_XXX)
+
+    # コンストラクタ
+    # router: TMiniRouter
+    def __init__(self, router):
+        self.router = router
+        self.server = router.server
+        self.last_event_id = router.request._headers.get('last-event-id', None)
+        self._send_queue = TMiniSendQueue(router.response._writer, self.send_queue_size, self.send_overflow)
+        self._last_sent = ticks_ms()
+
+    async def __aenter__(self):
+        response = self.router.response
+        response._write_status_code(HttpStatusCode.OK)
+        response._write_header('server', 'TMiniWebServer')
+        response._write_header('content-type', 'text/event-stream')
+        response._write_header('cache-control', 'no-cache')
+        response._write_header('connection', 'close')
+        if response._extra_headers:
+            for name, value in response._extra_headers.items():
+                response._write_header(name, value)
+        await response._drain('\r\n')
+        if self.server:
+            self.server.hub.attach(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.server:
+            self.server.hub.detach(self)
+        await self._send_queue.flush()
+        self._send_queue.close()
+        return False
+
+    # 切断しているかどうか
+    def is_closed(self):
+        return self._send_queue.closed
+
+    # イベントを送信する
+    # return: 送信キューに追加できたかどうか
+    async def send(self, data, event=None, id=None, retry=None):
+        self._last_sent = ticks_ms()
+        return await self._send_queue.put((encode_event(data, event, id, retry),))
+
+    # トピックを購読する
+    # webserver.hub.publish(topic, data, event=..., id=...) で配信されたイベントがこの接続に送信される
+    # ハブがイベントを保持している場合 (hub.history_size) は、Last-Event-ID より後のイベントを再送する
+    def subscribe(self, topic):
+        hub = self.server.hub
+        if self.last_event_id is not None:
+            for id, data, event in hub.history(topic, self.last_event_id):
+                self._send_queue.offer((encode_event(data, event, id),))
+            self._send_queue.kick()
+        hub.subscribe(topic, self)
+
+    # トピックの購読を解除する
+    def unsubscribe(self, topic):
+        self.server.hub.unsubscribe(topic, self)
+
+    # クライアントが切断するまで待つ
+    async def wait_closed(self):
+        reader = self.router.request._reader
+        while not self.is_closed():
+            try:
+                if not await reader.read(64):
+                    break
+            except Exception:
+                break
+        self._send_queue.close()
+
+    # 送信キューの状態
+    def stats(self):
+        return self._send_queue.stats()
+
+    # ハブで同じフレームを共有する接続の種類
+    def _hub_kind(self):
+        return 'sse'
+
+    # ハブから配信するデータをイベント化する
+    def _hub_frame(self, data, event=None, id=None):
+        return (encode_event(data, event, id),)
+
+    # ハブが遅い購読者として切断する
+    # ストリームも閉じて、wait_closed で待っているハンドラを起こす
+    def _evict(self):
+        self._send_queue.close()
+        try:
+            self.router.response._writer.close()
+        except Exception:
+            pass
+
+    # ハブのスケジューラから定期的に呼び出される
+    # 送信が途絶えている場合はコメント行を送り、プロキシやブラウザに切断されないようにする
+    def _keepalive(self, now, hub):
+        if self.is_closed() or not hub.heartbeat_ms:
+            return
+        if ticks_diff(now, self._last_sent) >= hub.heartbeat_ms:
+            self._last_sent = now
+            if self._send_queue.offer((_HEARTBEAT,)):
+                self._send_queue.kick()
@@ -0,0 +1,179 @@
+import ustruct
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# 静的ファイルのパック (tools/tmini_pack.py で作成する)
+# ヘッダ: b'TMPK' / バージョン(B) / 予約(B) / ファイル数(H) / インデックスのサイズ(I)
+# インデックス: ファイル毎に パス長(H) パス / MIME長(B) MIME / ETag長(B) ETag / フラグ(B) / 位置(I) / サイズ(I)
+# 以降: ファイルの内容 (位置はパックの先頭からのバイト数)
+PACK_MAGIC = b'TMPK'
+PACK_VERSION = 1
+PACK_HEADER = '<4sBBHI'
+PACK_FLAG_GZIP = 0x01
+
+_HEADER_SIZE = ustruct.calcsize(PACK_HEADER)
+
+# ルートへのリクエストで探すファイル
+INDEX_FILES = ('index.html', 'index.htm')
+
+# Accept-Encoding ヘッダで gzip を受け付けるかどうか
+# gzip (x-gzip) の指定を優先し、なければ '*' に従う. q=0 は受け付けない
+# ヘッダがない場合は、gzip を展開できないクライアントとして扱う
+def accepts_gzip(accept_encoding):
+    if not accept_encoding:
+        return False
+    wildcard = False
+    for item in accept_encoding.split(','):
+        params = item.split(';')
+        coding = params[0].strip().lower()
+        refused = False
+        for param in params[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    refused = float(value) <= 0
+                except ValueError:
+                    pass
+        if coding == 'gzip' or coding == 'x-gzip':
+            return not refused
+        if coding == '*':
+            wildcard = not refused
+    return wildcard
+
+# 静的ファイルの提供元
+# find(path) でファイルの情報 (位置, サイズ, MIME, ETag, gzip) を探し、chunks(entry) で内容を少しずつ取り出す
+# 位置は提供元毎に異なる (パック: ファイル内の位置 / フリーズ: 内容の bytes)
+class TMiniAssetProvider:
+
+    def __init__(self):
+        self._index = {}    # パス -> (位置, サイズ, MIME, ETag, gzip)
+
+    # 準備する (サーバの開始時に呼び出す)
+    def open(self):
+        pass
+
+    # 終了する (サーバの停止時に呼び出す)
+    def close(self):
+        pass
+
+    # ファイル数
+    def count(self):
+        return len(self._index)
+
+    # リクエストされたパスのファイルを探す
+    # path: リクエストのパス ('/' の場合は index.html / index.htm)
+    # return: (位置, サイズ, MIME, ETag, gzip) / ない場合は None
+    def find(self, path):
+        path = path.strip('/')
+        if path:
+            return self._index.get(path, None)
+        for name in INDEX_FILES:
+            entry = self._index.get(name, None)
+            if entry:
+                return entry
+        return None
+
+    # ファイルの内容を先頭から少しずつ返すジェネレータ
+    def chunks(self, entry):
+        return iter(())
+
+# 1つのパックファイルから静的ファイルを返す提供元
+# ファイルを開くのは open() の1度だけで、以降は同じファイルハンドルを seek して必要な範囲だけ読み込む
+# (LittleFS でファイル毎に open / stat するとメタデータの探索に時間がかかるため)
+class TMiniAssetPack(TMiniAssetProvider):
+    chunk_size = 2 * 1024   # 1度に読み込むバイト数
+
+    # コンストラクタ
+    # path: パックファイルのパス
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._file = None
+
+    # インデックスを読み込み、パックファイルを開いたままにする
+    def open(self):
+        if self._file is not None:
+            return
+        f = open(self.path, 'rb')
+        try:
+            magic, version, _, count, index_size = ustruct.unpack(PACK_HEADER, f.read(_HEADER_SIZE))
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise ValueError(f'invalid asset pack: {self.path}')
+            self._index = self._parse_index(memoryview(f.read(index_size)), count)
+        except:
+            f.close()
+            raise
+        self._file = f
+        LOGGER.info(f'asset pack loaded: {self.path} ({count} files)')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ファイルの内容を chunk_size 毎に返す
+    # 他の接続と同じファイルハンドルを共有するため、読み込む度に seek する (seek と読み込みの間に await しない)
+    def chunks(self, entry):
+        offset, size = entry[0], entry[1]
+        buf = bytearray(min(size, self.chunk_size))
+        mv = memoryview(buf)
+        pos = 0
+        while pos < size:
+            n = min(len(buf), size - pos)
+            self._file.seek(offset + pos)
+            n = self._file.readinto(mv[:n])
+            if not n:
+                raise OSError('asset pack truncated')
+            pos += n
+            yield mv[:n]
+
+    @staticmethod
+    def _parse_index(data, count):
+        index = {}
+        pos = 0
+        for _ in range(count):
+            n, = ustruct.unpack_from('<H', data, pos)
+            path = bytes(data[pos + 2:pos + 2 + n]).decode()
+            pos += 2 + n
+            n = data[pos]
+            mime = bytes(data[pos + 1:pos + 1 + n]).decode()
+            pos += 1 + n
+            n = data[pos]
+            etag = bytes(data[pos + 1:pos + 1 + n]).decode()
+            pos += 1 + n
+            flags, offset, size = ustruct.unpack_from('<BII', data, pos)
+            pos += 9
+            index[path] = (offset, size, mime, etag, bool(flags & PACK_FLAG_GZIP))
+        return index
+
+# ファームウェアにフリーズしたモジュール (tools/tmini_freeze.py で作成する) から静的ファイルを返す提供元
+# フリーズした .mpy の bytes はフラッシュ上に置かれたまま (XIP) RAM にコピーされないため、
+# memoryview のスライスで送ればヒープもファイルシステムも使わない
+class TMiniFrozenAssets(TMiniAssetProvider):
+    chunk_size = 2 * 1024   # 1度に書き込むバイト数 (送りきれなかった分は uasyncio が RAM に溜めるため、大きくしすぎない)
+
+    # コンストラクタ
+    # module: モジュール名 or モジュール (ASSETS = {パス: (内容, サイズ, MIME, ETag, gzip)} を持つ)
+    def __init__(self, module):
+        super().__init__()
+        self.module = module
+
+    # モジュールの表をそのままインデックスとして使う
+    def open(self):
+        module = self.module
+        if isinstance(module, str):
+            # __import__ は 'a.b' の場合に a を返すため、属性をたどる
+            names = module.split('.')
+            module = __import__(module)
+            for name in names[1:]:
+                module = getattr(module, name)
+        self._index = module.ASSETS
+        LOGGER.info(f'frozen assets loaded: {len(self._index)} files')
+
+    def chunks(self, entry):
+        mv = memoryview(entry[0])
+        size = entry[1]
+        step = self.chunk_size
+        for pos in range(0, size, step):
+            yield mv[pos:pos + step]
@@ -0,0 +1,173 @@
+from . import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# テンプレートの構文
+#  {% args a, b=1 %}   : テンプレートの引数 (render の引数になる)
+#  {{ expr }}          : 式の値を HTML エスケープして出力
+#  {{! expr }}         : 式の値をそのまま出力
+#  {% if expr %} / {% elif expr %} / {% else %} / {% endif %}
+#  {% for x in expr %} / {% endfor %}
+#  {% include "name.html" a, b %} : 別のテンプレートを出力
+#  {# comment #}       : コメント
+#  {% その他 %}         : Python の文として実行
+
+_BLOCK_START = ('if', 'for', 'while')
+_BLOCK_MIDDLE = ('elif', 'else')
+_BLOCK_END = ('endif', 'endfor', 'endwhile')
+
+# 値を HTML エスケープする (& < > " ')
+def _escape(value):
+    s = str(value)
+    if '&' in s:
+        s = s.replace('&', '&amp;')
+    if '<' in s:
+        s = s.replace('<', '&lt;')
+    if '>' in s:
+        s = s.replace('>', '&gt;')
+    if '"' in s:
+        s = s.replace('"', '&quot;')
+    if "'" in s:
+        s = s.replace("'", '&#39;')     # 単一引用符で囲んだ属性値から抜け出せないようにする
+    return s
+
+# テンプレート名からプリコンパイル済みモジュールの名前を作る
+# ex) parts/header.html -> parts_header_html
+def module_name(name):
+    return name.strip('/').replace('/', '_').replace('.', '_').replace('-', '_')
+
+# テンプレートを Python のソースに変換する
+# 生成されるのは、出力する文字列を順に yield するジェネレータ関数 render(args...)
+# source: テンプレートの文字列
+# return: Python のソース
+def compile_template(source):
+    args = ''
+    lines = []
+    indent = 1
+    empty = False       # 直前にブロックを開始して、まだ中身がないかどうか
+
+    def emit(line):
+        nonlocal empty
+        lines.append('    ' * indent + line)
+        empty = False
+
+    def open_block(line):
+        nonlocal indent, empty
+        emit(line + ':')
+        indent += 1
+        empty = True
+
+    def close_block():
+        nonlocal indent
+        if empty:
+            emit('pass')
+        indent -= 1
+
+    pos = 0         # 未出力のテキストの先頭
+    scan = 0        # タグを探す位置
+    while True:
+        i = source.find('{', scan)
+        if i < 0 or i + 1 >= len(source):
+            break
+        kind = source[i + 1]
+        if kind not in '{%#':
+            scan = i + 1
+            continue
+        end_mark = '}}' if kind == '{' else kind + '}'
+        j = source.find(end_mark, i + 2)
+        if j < 0:
+            raise ValueError(f'unterminated tag at {i}')
+
+        if i > pos:
+            emit('yield ' + repr(source[pos:i]))
+        tag = source[i + 2:j].strip()
+        pos = scan = j + 2
+
+        if kind == '#':
+            continue
+        if kind == '{':
+            if tag.startswith('!'):
+                emit(f'yield str({tag[1:].strip()})')
+            else:
+                emit(f'yield _e({tag})')
+            continue
+
+        word = tag.split(None, 1)[0] if tag else ''
+        if word == 'args':
+            args = tag[4:].strip()
+            # 引数の指定の直後の改行は出力しない
+            if source.startswith('\n', pos):
+                pos = scan = pos + 1
+        elif word in _BLOCK_START:
+            open_block(tag)
+        elif word in _BLOCK_MIDDLE:
+            close_block()
+            open_block(tag)
+        elif word in _BLOCK_END:
+            close_block()
+        elif word == 'include':
+            params = tag[7:].strip().split(None, 1)
+            call = params[0] + (', ' + params[1] if len(params) > 1 else '')
+            emit(f'yield from _include({call})')
+        else:
+            emit(tag)
+
+    if pos < len(source):
+        emit('yield ' + repr(source[pos:]))
+    if indent != 1:
+        raise ValueError('unbalanced block')
+    if not any(line.lstrip().startswith('yield') for line in lines):
+        emit("yield ''")
+    return f'def render({args}):\n' + '\n'.join(lines) + '\n'
+
+# テンプレートエンジン
+# テンプレートファイルは初回に1度だけ Python のジェネレータ関数へ変換してキャッシュする
+# precompiled_package を指定した場合は、ホスト側で変換済み(.py / .mpy)のモジュールを優先して使用する
+class TMiniTemplate:
+    template_dir = '/templates'     # テンプレートファイルを置くディレクトリ
+    precompiled_package = None      # 変換済みモジュールのパッケージ名 ex) 'templates_c'
+    _cache = {}                     # テンプレート名 -> render 関数
+
+    # テンプレートの render 関数を取得する
+    # name: template_dir からの相対パス
+    @classmethod
+    def load(cls, name):
+        func = cls._cache.get(name, None)
+        if func is None:
+            func = cls._import(name) or cls._compile_file(name)
+            cls._cache[name] = func
+        return func
+
+    # テンプレートを出力するジェネレータを返す
+    # name: template_dir からの相対パス
+    # args: テンプレートの引数
+    @classmethod
+    def render(cls, name, *args):
+        return cls.load(name)(*args)
+
+    # キャッシュを破棄する (テンプレートファイルを更新した場合)
+    @classmethod
+    def clear_cache(cls):
+        cls._cache = {}
+
+    # 変換済みモジュールを読み込む
+    @classmethod
+    def _import(cls, name):
+        if not cls.precompiled_package:
+            return None
+        try:
+            module = __import__(f'{cls.precompiled_package}.{module_name(name)}', None, None, ('render',))
+            LOGGER.debug(f'template loaded (precompiled): {name}')
+            return module.render
+        except ImportError:
+            return None
+
+    # テンプレートファイルを読み込んで変換する
+    @classmethod
+    def _compile_file(cls, name):
+        with open(cls.template_dir + '/' + name.strip('/'), 'r') as f:
+            code = compile_template(f.read())
+        namespace = {'_e': _escape, '_include': cls.render}
+        exec(code, namespace)
+        LOGGER.debug(f'template compiled: {name}')
+        return namespace['render']
@@ -3,15 +3,40 @@ import sys
 import re
 
 from . import logging
-from .tminiwebserver_util import TMiniWebServerUtil
+from .tminiwebserver_util import TMiniWebServerUtil, HttpStatusCode
 
 from .tminirequest import TMiniRequest
 from .tminiresponse import TMiniResponse
 from .tminirouter import TMiniRouter
 from .tminiwebsocket import TMiniWebSocket
+from .tminihub import TMiniHub
+from .tminicache import TMiniResponseCache, TMiniNegativeCache, _CaptureWriter
+from .tminiworker import TMiniWorker
+from .tministatic import TMiniAssetPack, TMiniFrozenAssets, accepts_gzip
+from .tminiratelimit import TMiniRateLimiter
+from .tminicors import TMiniCors
+from .tminipool import TMiniPool, DEFAULT_POOLS, PRIORITY_API, PRIORITY_STATIC, PRIORITY_WEBSOCKET
 
 LOGGER = logging.getLogger(__name__)
 
+# 静的ファイルに使えるメソッド
+_STATIC_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# gzip で格納したファイルの応答に付けるヘッダ (Accept-Encoding によって返す内容が変わる)
+_VARY_ENCODING = {'vary': 'Accept-Encoding'}
+
+# 型を指定しないパスのパラメーター (<id>) の変換. 数字のみの場合は int にする
+def _convert_legacy(s):
+    return int(s) if s.isdigit() else s
+
+# パスのパラメーターの型 (<型:名前>)
+# 型: (正規表現, 変換する関数)
+_CONVERTERS = {
+    'int': ('(\\d+)', int),
+    'str': ('([^/]+)', None),
+    'path': ('(.*)', None),     # '/' を含む残りのパス全体
+    None: ('(\\w*)', _convert_legacy),
+}
+
 # ルート毎の処理
 class _WebServerRoute:
     # コンストラクタ
@@ -20,12 +45,28 @@ class _WebServerRoute:
     # func           : 処理内容
     # route_arg_names: 置換するキーのリスト
     # routeRegex     : <>指定された場合に置換するための正規表現
-    def __init__(self, route, method, func, route_arg_names, routeRegex):
+    # options        : デコレータで指定されたオプション
+    # converters     : route_arg_names 毎の値を変換する関数 (None: 文字列のまま)
+    # pattern        : 正規表現の文字列 (末尾の '$' を除く)
+    def __init__(self, route, method, func, route_arg_names, routeRegex, options, converters=None, pattern=None):
         self.route = route
         self.method = method
         self.func = func
         self.route_arg_names = route_arg_names
         self.route_regex = routeRegex
+        self.converters = converters or [_convert_legacy] * len(route_arg_names)
+        self.pattern = pattern
+        self.cache_ttl = options.get('cache_ttl', 0)
+        self.rate_limit = TMiniRateLimiter.create(options.get('rate_limit', None))
+        self.priority = options.get('priority', PRIORITY_WEBSOCKET if method == 'WEBSOCKET' else PRIORITY_API)
+        self.max_body = options.get('max_body', None)
+        self.chain = func       # ミドルウェアを組み込んだ呼び出し (ミドルウェアがない場合は func そのもの)
+
+# ミドルウェアと次の処理をつなぐ
+def _bind_middleware(middleware, next):
+    async def call(router):
+        return await middleware(router, next)
+    return call
 
 # WebServer
 class TMiniWebServer:
@@ -38,10 +79,15 @@ class TMiniWebServer:
     # URL毎の処理を登録する
     # url_path: URLのパス
     # method  : HTTPメソッド
+    # options : ルート毎のオプション
+    #   cache_ttl : 指定した秒数の間、レスポンスをキャッシュする
+    #   rate_limit: クライアント毎のリクエスト数の制限 (1秒あたりの数, 連続して受け付ける数) / TMiniRateLimiter
+    #   priority  : 優先度クラス ('high' など). 同時に処理する数はクラス毎に制限する (既定: 'api' / WebSocket は 'websocket')
+    #   max_body  : 受け付ける内容のサイズの上限(バイト). サーバの max_body より優先する
     @classmethod
-    def route(cls, url_path, method='GET'):
+    def route(cls, url_path, method='GET', **options):
         def route_decorator(func):
-            item = (url_path, method, func)
+            item = (url_path, method, func, options)
             cls._decorate_route_handlers.append(item)
             return func
         return route_decorator
@@ -57,37 +103,147 @@ class TMiniWebServer:
     # port   : Webサーバのポート
     # bindIP : バインドするIPアドレス
     # wwwroot: 静的ファイルを置くディレクトリ
-    def __init__(self, port = 80, bindIP = '0.0.0.0', wwwroot = '/wwwroot'):
+    # ws_ping_interval: WebSocketの受信が途絶えてから PING を送るまでの秒数 (0: 送らない)
+    # ws_pong_timeout : PING を送ってから PONG を待つ秒数. 超えた場合は CLOSE_GOING_AWAY で切断
+    # ws_idle_timeout : WebSocketでデータを送受信しないまま切断するまでの秒数 (0: 切断しない)
+    # sse_heartbeat   : Server-Sent Events で送信が途絶えてからコメントを送るまでの秒数 (0: 送らない)
+    # cache_size      : ルートハンドラのレスポンスキャッシュの合計サイズの上限(バイト)
+    # asset_pack      : 静的ファイルのパック (tools/tmini_pack.py で作成) のパス. パックにないファイルは wwwroot から探す
+    # frozen_assets   : 静的ファイルをフリーズしたモジュール (tools/tmini_freeze.py で作成) の名前. asset_pack とは同時に指定できない
+    # rate_limit      : 全てのリクエストに対するクライアント毎の制限 (1秒あたりの数, 連続して受け付ける数) / TMiniRateLimiter
+    # pools           : 優先度クラス毎に同時に処理する数 (0: 制限しない). 指定したクラスのみ既定値(DEFAULT_POOLS)を変更・追加する
+    #                   ex) {'static': 1, 'sse': 4}
+    # max_body        : 受け付ける内容のサイズの上限(バイト). 超えた場合は内容を読み込まずに 413 で応答する (None: 制限しない)
+    # cors            : CORS の設定 (TMiniCors の引数の dict / True: 既定の設定 / TMiniCors)
+    #                   ex) {'origins': ['http://192.168.0.2:8080'], 'max_age': 3600}
+    # combined_routes : メソッド毎に全てのルートを1つの正規表現にまとめ、1回の match でルートを探す
+    # not_found_cache : 見つからなかった静的ファイルのパスをキャッシュする数 (0: キャッシュしない)
+    # not_found_ttl   : 見つからなかったパスをキャッシュする秒数
+    def __init__(self, port = 80, bindIP = '0.0.0.0', wwwroot = '/wwwroot',
+                 ws_ping_interval = 30, ws_pong_timeout = 10, ws_idle_timeout = 0, sse_heartbeat = 15,
+                 cache_size = 8 * 1024, asset_pack = None, frozen_assets = None, rate_limit = None,
+                 pools = None, max_body = None, cors = None, combined_routes = False,
+                 not_found_cache = 32, not_found_ttl = 60):
         self._server_ip = bindIP
         self._server_port = port
         self._wwwroot = wwwroot
+        self._ws_ping_interval = ws_ping_interval
+        self._ws_pong_timeout = ws_pong_timeout
+        self._ws_idle_timeout = ws_idle_timeout
+        self._sse_heartbeat = sse_heartbeat
         self._running = False
         self._route_handlers = []
+        self._middlewares = []      # (ミドルウェア, パスの前方一致) のリスト
+        self._combined_routes = combined_routes
+        self._combined = {}         # メソッド -> (まとめた正規表現, [(ルートのグループの番号, _WebServerRoute)])
         self._request = None
         self._response = None
+        self.hub = TMiniHub()
+        self.cache = TMiniResponseCache(cache_size)
+        self.not_found = TMiniNegativeCache(not_found_cache, not_found_ttl)
+        self.worker = TMiniWorker()
+        self.rate_limit = TMiniRateLimiter.create(rate_limit)
+        self.max_body = max_body
+        self.cors = TMiniCors.create(cors)
+        limits = dict(DEFAULT_POOLS)
+        if pools:
+            limits.update(pools)
+        self.pools = {name: TMiniPool(name, limit) for name, limit in limits.items()}
+        if asset_pack and frozen_assets:
+            raise ValueError('asset_pack and frozen_assets are exclusive')
+        self.assets = None      # 静的ファイルの提供元 (TMiniAssetProvider)
+        if asset_pack:
+            self.assets = TMiniAssetPack(asset_pack)
+        elif frozen_assets:
+            self.assets = TMiniFrozenAssets(frozen_assets)
         self._add_route_item(self._decorate_route_handlers)
 
+    # ミドルウェアを登録する
+    # 登録順に外側から呼び出され、各ルートの呼び出しはサーバの開始時(開始後の登録ではその時)に1度だけ組み立てる
+    # async def middleware(router, next):
+    #     ## 前処理 (next を呼ばずに応答すれば、以降の処理を打ち切る)
+    #     await next(router)
+    #     ## 後処理
+    # middleware: ミドルウェア
+    # prefix    : 指定した場合は、ルートのパスがこれで始まるルートにのみ適用する ex) '/api'
+    def use(self, middleware, prefix=None):
+        self._middlewares.append((middleware, prefix))
+        if self.is_started():
+            self._compose_middlewares()
+
+    # 各ルートの呼び出しにミドルウェアを組み込む
+    # キャッシュするルートはミドルウェアの内側でキャッシュを確認するため、キャッシュにある場合もミドルウェアを通る
+    def _compose_middlewares(self):
+        for route in self._route_handlers:
+            chain = self._bind_cache(route) if route.cache_ttl else route.func
+            for middleware, prefix in reversed(self._middlewares):
+                if prefix is None or route.route.startswith(prefix):
+                    chain = _bind_middleware(middleware, chain)
+            route.chain = chain
+
     # _route_handlers を構築する
     # source_decorators: デコレータで登録した処理タプルのリスト
     def _add_route_item(self, source_decorators):
-        for url_path, method, func in source_decorators:
-            # <> で囲われている場合は、正規表現で置換する
-            regex_list = ['/(\\w*)' if s.startswith('<') and s.endswith('>') else '/' + s for s in url_path.split('/') if s]
-            route_str = ''.join(regex_list) + '$'
-            route_regex = re.compile(route_str)
-            LOGGER.debug(f"  url_path: {url_path} -> regex: {route_str}")
-
-            route_arg_names = [s[1:-1] for s in url_path.split('/') if s.startswith('<') and s.endswith('>')]
-            self._route_handlers.append(_WebServerRoute(url_path, method.upper(), func, route_arg_names, route_regex))
+        for url_path, method, func, options in source_decorators:
+            # <> で囲われている場合は、型に応じた正規表現で置換する
+            regex_list = []
+            route_arg_names = []
+            converters = []
+            for s in url_path.split('/'):
+                if not s:
+                    continue
+                if s.startswith('<') and s.endswith('>'):
+                    kind, name = s[1:-1].split(':', 1) if ':' in s else (None, s[1:-1])
+                    if kind not in _CONVERTERS:
+                        raise ValueError(f'unknown converter: {kind} ({url_path})')
+                    regex, converter = _CONVERTERS[kind]
+                    regex_list.append('/' + regex)
+                    route_arg_names.append(name)
+                    converters.append(converter)
+                else:
+                    regex_list.append('/' + s)
+            pattern = ''.join(regex_list)
+            route_regex = re.compile(pattern + '$')
+            LOGGER.debug(f"  url_path: {url_path} -> regex: {pattern}$")
+
+            route = _WebServerRoute(url_path, method.upper(), func, route_arg_names, route_regex, options, converters, pattern)
+            if route.priority not in self.pools:
+                raise ValueError(f'unknown priority: {route.priority} ({url_path})')
+            self._route_handlers.append(route)
             LOGGER.debug(f'route add : {url_path}, {route_arg_names}')
 
+        if self._combined_routes:
+            self._combine_routes()
+
+    # メソッド毎に全てのルートを1つの正規表現 (ルート1|ルート2|...) にまとめる
+    # 各ルートをグループで囲い、どのグループに一致したかでルートを判別する
+    # (MicroPython の re は (?:...) を使えないため、ルートを囲うグループもパラメーターと同じく番号を数える)
+    def _combine_routes(self):
+        combined = {}
+        for route in self._route_handlers:
+            patterns, groups, count = combined.setdefault(route.method, ([], [], [0]))
+            patterns.append('(' + route.pattern + '$)')
+            groups.append((count[0] + 1, route))
+            count[0] += 1 + len(route.route_arg_names)
+        self._combined = {method: (re.compile('|'.join(patterns)), groups)
+                          for method, (patterns, groups, _) in combined.items()}
+
     # サーバを開始
     async def start(self):
         if self.is_started():
             return
 
+        self._compose_middlewares()
+        if self.cors:
+            self.cors.build(self._all_methods())
+
+        # 静的ファイルのインデックスは開始時に1度だけ読み込む
+        if self.assets:
+            self.assets.open()
+        self.not_found.invalidate()
         self._server = await asyncio.start_server(self._server_proc, host=self._server_ip, port=self._server_port, backlog = 5)
         self._running = True
+        self.hub.start_keepalive(self._ws_ping_interval, self._ws_pong_timeout, self._ws_idle_timeout, self._sse_heartbeat)
         LOGGER.info(f'start server on {self._server_ip}:{self._server_port}')
 
     # サーバを停止
@@ -101,6 +257,9 @@ class TMiniWebServer:
             self._server.close()
         except:
             pass
+        self.hub.stop_keepalive()
+        if self.assets:
+            self.assets.close()
         self._running = False
         LOGGER.info(f'stop server')
 
@@ -142,6 +301,8 @@ class TMiniWebServer:
         try:
             addr = writer.get_extra_info('peername')
             LOGGER.info(f"connected by {addr}")
+            if addr:
+                request._remote_addr = addr[0]
 
             if not await self._processRequest(request, response):
                 LOGGER.info('process request failed.')
@@ -152,9 +313,12 @@ class TMiniWebServer:
 
     # クライアントのリクエスト処理
     async def _processRequest(self, request, response):
-        result, code = await request.parse()
+        # 内容はルートと制限を確認してから読み込む
+        result, code = await request.parse(False)
         if result == False:
-            return response.write_error_response(code)
+            return await response.write_error_response(code)
+        if self.rate_limit and not await self._check_rate_limit(self.rate_limit, request, response):
+            return True
 
         is_upg = request.check_upgrade()
         if not is_upg:
@@ -165,7 +329,7 @@ class TMiniWebServer:
             return await self._routing_websocket(request, response)
         else:
             # upgrade ヘッダが指定され、"websocket" 以外はエラーとする
-            return response.write_bad_request()
+            return await response.write_bad_request()
 
     # 通常のHTTP通信処理
     async def _routing_http(self, request, response):
@@ -173,12 +337,35 @@ class TMiniWebServer:
         path, method = request.get()
         route, route_args = self._get_route_handler(path, method)
         try:
+            origin = request._headers.get('origin', None)
+            if not route:
+                if method == 'HEAD':
+                    # HEAD のルートがない場合は GET のルートでヘッダのみ返す
+                    route, route_args = self._get_route_handler(path, 'GET')
+                elif method == 'OPTIONS':
+                    await self._response_options(request, response, path, origin)
+                    return True
+            if method == 'HEAD':
+                response.set_head_only()
+            if self.cors and origin:
+                self.cors.apply(response, origin)
+
             if not route:
-                await self._response_file(response, method, path)
+                # GET・HEAD は静的ファイルを優先し、ファイルがない場合にメソッドの異なるルートを確認する
+                async with self.pools[PRIORITY_STATIC]:
+                    await self._response_file(request, response, method, path)
                 return True
-            else:
+            if route.rate_limit and not await self._check_rate_limit(route.rate_limit, request, response):
+                return True
+            if not await self._check_body(route, request, response):
+                return True
+            async with self.pools[route.priority]:
+                # Expect: 100-continue の場合は、処理を始める時に内容の送信を促す
+                if request._content_length and request._headers.get('expect', None):
+                    await response.write_continue()
+                await request.parse_body()
                 LOGGER.debug(f'found route: {path}, args: {route_args}')
-                router = TMiniRouter(request, response, route_args)
+                router = TMiniRouter(request, response, route_args, self)
                 return await self._fire_route(route, router)
         finally:
             await response.close()
@@ -188,22 +375,66 @@ class TMiniWebServer:
         LOGGER.debug('in _routing_websocket')
         path, _ = request.get()
         route, route_args = self._get_route_handler(path, 'websocket')
+        websocket = None
+        pool = None
         try:
             if not route:
                 LOGGER.debug(f'not found websocket route. [{path}]')
                 await response.write_bad_request()
                 return True
-            else:
-                LOGGER.debug(f'found route: {path}, args: {route_args}')
-                websocket = await TMiniWebSocket.factory(request, response, route_args)
-                return await self._fire_route(route, websocket)
+            elif route.rate_limit and not await self._check_rate_limit(route.rate_limit, request, response):
+                return True
+
+            # WebSocket は接続が長く続くため、空きを待たずに断る
+            pool = self.pools[route.priority]
+            if not pool.try_acquire():
+                LOGGER.info(f'websocket pool is full. [{path}]')
+                pool = None
+                await response.write_error_response(HttpStatusCode.SERVICE_UNAVAILABLE)
+                return True
+
+            LOGGER.debug(f'found route: {path}, args: {route_args}')
+            websocket = await TMiniWebSocket.factory(request, response, route_args, self)
+            self.hub.attach(websocket)
+            return await self._fire_route(route, websocket)
         finally:
-            pass
+            # 切断した接続の購読を解除する
+            if websocket is not None:
+                self.hub.detach(websocket)
+            if pool is not None:
+                pool.release()
+
+    # クライアント毎のリクエスト数の制限を確認し、超えている場合は 429 で応答する
+    # limiter: TMiniRateLimiter
+    # return: True: 受け付ける / False: 制限した (応答済み)
+    async def _check_rate_limit(self, limiter, request, response):
+        retry_after = limiter.take(request._remote_addr)
+        if not retry_after:
+            return True
+        LOGGER.info(f'rate limited: {request._remote_addr} {request._req_path}')
+        await response.write_response(http_status=HttpStatusCode.TOO_MANY_REQUESTS,
+                                      content=HttpStatusCode.messages[HttpStatusCode.TOO_MANY_REQUESTS],
+                                      headers={'retry-after': retry_after})
+        return False
+
+    # 内容のサイズと Expect ヘッダを確認し、受け付けない場合は応答する (内容は読み込まない)
+    # return: True: 受け付ける / False: 受け付けない (応答済み)
+    async def _check_body(self, route, request, response):
+        max_body = route.max_body if route.max_body is not None else self.max_body
+        if max_body is not None and request._content_length > max_body:
+            LOGGER.info(f'request body too large: {request._content_length} > {max_body} [{request._req_path}]')
+            await response.write_error_response(HttpStatusCode.REQUEST_ENTITY_TOO_LARGE)
+            return False
+        expect = request._headers.get('expect', None)
+        if expect and expect.lower() != '100-continue':
+            await response.write_error_response(HttpStatusCode.EXPECTATION_FAILED)
+            return False
+        return True
 
     # ルートハンドラを検索する
     # url_path: ルートパス
     # method  : HTTPメソッド
-    # return: (ハンドラメソッド, キーのハッシュ)
+    # return: (_WebServerRoute, キーのハッシュ)
     def _get_route_handler(self, url_path, method):
         LOGGER.debug(f'search {url_path},{method}')
         try:
@@ -213,6 +444,8 @@ class TMiniWebServer:
 
             url_path = url_path.rstrip('/')
             method = method.upper()
+            if self._combined_routes:
+                return self._match_combined(url_path, method)
 
             # 登録されているルートハンドラからURLが対応するものを抽出
             filterd_handlers = [h for h in self._route_handlers if h.method == method and h.route_regex.match(url_path)]
@@ -221,35 +454,178 @@ class TMiniWebServer:
 
             handler = filterd_handlers[0]
             if handler.route_arg_names and (m := handler.route_regex.match(url_path)):
-                # <xxx> で指定された部分を辞書化する
-                values = m.groups()
-                values = list(map(lambda s: int(s) if s.isdigit() else s, values))
-                route_args = dict(zip(handler.route_arg_names, values))
+                # <xxx> で指定された部分を型に応じて変換して辞書化する
+                route_args = {}
+                for i, name in enumerate(handler.route_arg_names):
+                    value = m.group(i + 1)
+                    converter = handler.converters[i]
+                    route_args[name] = converter(value) if converter else value
             else:
                 route_args = None
-            return (handler.func, route_args)
+            return (handler, route_args)
 
         except Exception as ex:
             sys.print_exception(ex)
             LOGGER.error(f"  {url_path}, {method}")
             return (None, None)
 
+    # まとめた正規表現でルートハンドラを検索する
+    # return: (_WebServerRoute, キーのハッシュ)
+    def _match_combined(self, url_path, method):
+        entry = self._combined.get(method, None)
+        if entry is None:
+            return (None, None)
+        m = entry[0].match(url_path)
+        if not m:
+            return (None, None)
+        for index, handler in entry[1]:
+            # 一致しなかったグループの start は -1 (group と違い文字列を作らない)
+            if m.start(index) < 0:
+                continue
+            if not handler.route_arg_names:
+                return (handler, None)
+            route_args = {}
+            for i, name in enumerate(handler.route_arg_names):
+                value = m.group(index + 1 + i)
+                converter = handler.converters[i]
+                route_args[name] = converter(value) if converter else value
+            return (handler, route_args)
+        return (None, None)
+
     # 静的ファイルを返す
-    async def _response_file(self, response, method, path):
+    async def _response_file(self, request, response, method, path):
+        if method == 'HEAD':
+            method = 'GET'
+        if method == 'GET' and self.assets:
+            # パック・フリーズしたモジュールにあれば、そこから返す
+            entry = self.assets.find(path)
+            if entry:
+                # gzip で格納したファイルは、gzip を受け付けるクライアントにのみ返す
+                if not entry[4] or accepts_gzip(request._headers.get('accept-encoding', None)):
+                    LOGGER.debug(f'response_file (asset). [{path}]')
+                    await response.write_response_from_asset(self.assets, entry, request._headers.get('if-none-match', None))
+                    return
+                # 受け付けない場合は wwwroot のファイルを返し、ない場合は 406 を返す
+                LOGGER.debug(f'response_file (asset, gzip not accepted). [{path}]')
+                file_phys_path = self.get_phys_path_in_wwwroot(path)
+                if file_phys_path is None:
+                    await response.write_response(content=HttpStatusCode.messages[HttpStatusCode.NOT_ACCEPTABLE],
+                                                  http_status=HttpStatusCode.NOT_ACCEPTABLE, headers=_VARY_ENCODING)
+                else:
+                    await response.write_response_from_file(file_phys_path, headers=_VARY_ENCODING)
+                return
         if method == 'GET':
+            # 最近見つからなかったパスは、ファイルもルートの一覧も探さずに記録した応答を返す
+            allow = self.not_found.get(path)
+            if allow is not None:
+                LOGGER.debug(f'response_file (not found, cached). [{path}]')
+                await self._response_not_found(response, allow)
+                return
             # GET 処理の場合はファイルを探してあれば返す
             file_phys_path = self.get_phys_path_in_wwwroot(path)
             LOGGER.debug(f'response_file. [{file_phys_path}]')
+            if file_phys_path is None:
+                allow = self._allowed_methods(path)
+                self.not_found.add(path, allow)
+                await self._response_not_found(response, allow)
+                return
             await response.write_response_from_file(file_phys_path)
         else:
-            # GET以外はエラー
+            # GET・HEAD以外は、パスにルートか静的ファイルがあれば 405、どちらもなければ 404 を返す
             LOGGER.debug(f'not found route. [{path}]')
-            await response.write_bad_request()
+            allow = self.not_found.get(path)
+            if allow is None:
+                allow = self._allowed_methods(path)
+                if not allow:
+                    if (self.assets and self.assets.find(path)) or self.get_phys_path_in_wwwroot(path):
+                        allow = _STATIC_METHODS
+                    else:
+                        self.not_found.add(path, allow)
+            await self._response_not_found(response, allow)
+
+    # 静的ファイルが見つからなかった場合の応答
+    # allow: パスに対応するルートで使えるメソッドのリスト. ルートはあるが、メソッドが異なる場合は 405 を返す
+    async def _response_not_found(self, response, allow):
+        if allow:
+            await self._response_method_not_allowed(response, allow)
+        else:
+            await response.write_not_found()
+
+    # 指定したパスで使えるメソッドを返す (ルートの一覧から作る)
+    # return: メソッドのリスト / パスに対応するルートがない場合は空のリスト
+    def _allowed_methods(self, url_path):
+        url_path = url_path.rstrip('/')
+        methods = []
+        for h in self._route_handlers:
+            if h.method != 'WEBSOCKET' and h.method not in methods and h.route_regex.match(url_path):
+                methods.append(h.method)
+        if methods:
+            if 'GET' in methods and 'HEAD' not in methods:
+                methods.append('HEAD')
+            if 'OPTIONS' not in methods:
+                methods.append('OPTIONS')
+        return methods
+
+    # 全てのルートで使えるメソッドを返す (CORS のプリフライト用)
+    def _all_methods(self):
+        methods = list(_STATIC_METHODS)
+        for h in self._route_handlers:
+            if h.method != 'WEBSOCKET' and h.method not in methods:
+                methods.append(h.method)
+        return methods
+
+    # 405 Method Not Allowed を返す
+    # allow: 使えるメソッドのリスト
+    async def _response_method_not_allowed(self, response, allow):
+        await response.write_response(http_status=HttpStatusCode.METHOD_NOT_ALLOWED,
+                                      content=HttpStatusCode.messages[HttpStatusCode.METHOD_NOT_ALLOWED],
+                                      headers={'allow': ', '.join(allow)})
+
+    # OPTIONS に応答する
+    # CORS のプリフライトは組み立て済みの応答を返し、それ以外は使えるメソッドを Allow ヘッダで返す
+    async def _response_options(self, request, response, path, origin):
+        if (self.cors and origin and 'access-control-request-method' in request._headers
+                and await self.cors.write_preflight(response, origin)):
+            return
+        allow = self._allowed_methods(path) or _STATIC_METHODS
+        await response.write_response(http_status=HttpStatusCode.NO_CONTENT, content='',
+                                      headers={'allow': ', '.join(allow)})
+
+    # キャッシュを使用してデコレータを実行する呼び出しを作る
+    # キャッシュにない場合は、レスポンスをバッファに溜めながらハンドラを実行し、成功(2xx)した場合にキャッシュする
+    # キャッシュするのはハンドラの出力 (ステータス・ハンドラのヘッダ・内容) のみで、
+    # ミドルウェアや CORS が add_header で追加したヘッダは送出時にリクエスト毎に書き込む
+    def _bind_cache(self, route):
+        # キャッシュするルートがある場合のみ読み込む
+        from .tminicodec import negotiate
+
+        async def call(router):
+            request, response = router.request, router.response
+            path, _ = request.get()
+
+            async def produce():
+                capture = _CaptureWriter(response._writer)
+                captured = TMiniResponse(capture)
+                # ミドルウェアが router に設定した値を引き継ぐため、応答先だけ差し替えてハンドラを実行する
+                router.response = captured
+                try:
+                    await route.func(router)
+                finally:
+                    router.response = response
+                data = bytes(capture.buf)
+                return data, route.cache_ttl if data.startswith(b'HTTP/1.1 2') else 0
+
+            # 応答の形式(write_data)は Accept ヘッダで変わるため、選ばれる形式もキーに含める
+            accept = negotiate(request._headers.get('accept', None))
+            # HEAD は GET と同じキャッシュを使う (送出時にヘッダのみになる)
+            data = await self.cache.fetch((route.method, path, request._query_string, accept), produce)
+            await response._drain_cached(data)
+        return call
 
     # デコレータを実行
     async def _fire_route(self, route, router):
         try:
-            await route(router)
+            await route.chain(router)
             return True
 
         except Exception as ex:
@@ -84,6 +84,7 @@ class TMiniWebServerUtil:
     }
 
 class HttpStatusCode:
+    CONTINUE = 100
     SWITCH_PROTOCOLS = 101
     OK = 200
     CREATED = 201
@@ -119,6 +120,7 @@ class HttpStatusCode:
     UNSUPPORTED_MEDIA_TYPE = 415
     REQUESTED_RANGE_NOT_SATISFIABLE = 416
     EXPECTATION_FAILED = 417
+    TOO_MANY_REQUESTS = 429
 
     INTERNAL_SERVER_ERROR = 500
     NOT_IMPLEMENTED = 501
@@ -128,6 +130,7 @@ class HttpStatusCode:
     HTTP_VERSION_NOT_SUPPORTED = 505
 
     messages = {
+        CONTINUE: 'Continue',
         SWITCH_PROTOCOLS: 'Switching Protocols',
         OK: 'OK',
         CREATED: 'Created',
@@ -161,6 +164,7 @@ class HttpStatusCode:
         UNSUPPORTED_MEDIA_TYPE: 'Unsupported Media Type',
         REQUESTED_RANGE_NOT_SATISFIABLE: 'Requested Range Not Satisfiable',
         EXPECTATION_FAILED: 'Expectation Failed',
+        TOO_MANY_REQUESTS: 'Too Many Requests',
         INTERNAL_SERVER_ERROR: 'Internal Server Error',
         NOT_IMPLEMENTED: 'Not Implemented',
         BAD_GATEWAY: 'Bad Gateway',
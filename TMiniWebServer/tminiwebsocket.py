@@ -1,33 +1,54 @@
 import binascii
 import hashlib
+from time import ticks_ms, ticks_us, ticks_diff
 from . import logging
 from .tminiwebserver_util import HttpStatusCode
 from .tminirouter import TMiniRouter
-from .uwebsockets import Websocket
+from .uwebsockets import Websocket, frame_header, frame_view, payload_of, buffer_len, OP_BYTES, OP_TEXT, OP_PING, CLOSE_OK, CLOSE_GOING_AWAY, CLOSE_POLICY_VIOLATION
+from .tminisendqueue import TMiniSendQueue, OVERFLOW_BLOCK
+from . import tminiwsdeflate
 
 LOGGER = logging.getLogger(__name__)
 
+# 死活確認の PING (送信キューから送るフレーム)
+_PING_FRAME = (frame_header(OP_PING, 0),)
+
 # WebSocket通信処理をするクラス
 class TMiniWebSocket(TMiniRouter):
+    max_message_size = 16 * 1024    # 受信メッセージの最大サイズ(超えた場合は CLOSE_TOO_BIG で切断)
+    send_queue_size = 8             # 送信キューに溜められる最大フレーム数
+    send_overflow = OVERFLOW_BLOCK  # 送信キューが満杯の場合の動作 (OVERFLOW_XXX)
+    deflate_enabled = True          # クライアントが提案した場合に permessage-deflate を使用するかどうか
+    deflate_threshold = 128         # このバイト数未満のペイロードは圧縮せずに送信する
+    deflate_wbits = 10              # 圧縮/伸長のウィンドウサイズ(2^n バイト)
+
     @classmethod
-    async def factory(cls, req, res, args):
-        websocket = TMiniWebSocket(req, res, args)
+    async def factory(cls, req, res, args, server=None):
+        websocket = TMiniWebSocket(req, res, args, server)
         if await websocket.handshake() == False:
             LOGGER.debug('handshake failed.')
         return websocket
 
     # コンストラクタ
-    def __init__(self, req, res, args):
-        super().__init__(req, res, args)
+    def __init__(self, req, res, args, server=None):
+        super().__init__(req, res, args, server)
         self._websocket = Websocket(reader=req._reader, writer=res._writer)
+        self._websocket.max_message_size = self.max_message_size
+        self._send_queue = TMiniSendQueue(res._writer, self.send_queue_size, self.send_overflow, self._on_overflow_close)
+        self._raw_bytes = 0         # 圧縮前のペイロードのバイト数
+        self._deflate_frames = 0    # 圧縮して送信したフレーム数
+        self._deflate_us = 0        # 圧縮に要した時間(マイクロ秒)
+        self._last_active = ticks_ms()  # 最後にデータを送受信した時刻
 
     # 切断しているかどうか
     def is_closed(self):
         return not self._websocket.open
 
     # 切断する
-    async def close(self):
-        self._websocket.close()
+    # code: クローズコード (CLOSE_XXX)
+    async def close(self, code=CLOSE_OK):
+        self._websocket.close(code=code)
+        self._send_queue.close()
 
     # websocket のコネクション確立する
     async def handshake(self):
@@ -45,17 +66,149 @@ class TMiniWebSocket(TMiniRouter):
     async def receive(self):
         while not self.is_closed():
             try:
-                return await self._websocket.recv()
+                data = await self._websocket.recv()
+                self._last_active = ticks_ms()
+                return data
+            except Exception as ex:
+                LOGGER.error(f'WebSocket closed. (exception : {ex})')
+                return None
+        return None
+
+    # クライアントから断片単位で受信する
+    # メッセージ全体をバッファしないため、大きなバイナリの受信に使用する
+    # return:
+    #  (opcode, data, fin): opcode は OP_TEXT or OP_BYTES, data は bytes, fin は最後の断片かどうか
+    #  None: 切断時
+    async def receive_fragment(self):
+        while not self.is_closed():
+            try:
+                return await self._websocket.recv_fragment()
             except Exception as ex:
                 LOGGER.error(f'WebSocket closed. (exception : {ex})')
                 return None
         return None
 
     # クライアントにデータを送信する
-    # data:
-    # type:
-    def send(self, data):
-        self._websocket.send(data)
+    # 送信キューを経由して drain するため、回線より速く送信しても内部バッファは増え続けない
+    # data: str の場合はテキスト、1バイト単位のバッファ(bytes, bytearray, array('B'), memoryview)はバイナリとして送信
+    #       array('h') など要素が2バイト以上のバッファは TypeError (送信前に bytes に変換するか memoryview を 'B' で作り直す)
+    #       バッファはコピーせずにキューに積むため、送信されるまで内容を変更しないこと
+    # return: 送信キューに追加できたかどうか
+    async def send(self, data):
+        if self.is_closed():
+            return False
+        self._last_active = ticks_ms()
+        return await self._send_queue.put(self._frame(data))
+
+    # 呼び出し側が確保したバッファからコピーせずに送信する
+    # buf   : uwebsockets.frame_buffer(size) で確保したバッファ
+    #         ペイロードは buf[FRAME_HEADROOM:FRAME_HEADROOM + length] に書き込んでおく
+    # length: ペイロードのバイト数
+    # binary: バイナリとして送信するかどうか (False の場合はテキスト)
+    # 戻った時点でバッファは再利用できる (圧縮は行わない)
+    # return: 送信できたかどうか
+    async def send_into(self, buf, length, binary=True):
+        if self.is_closed():
+            return False
+        self._last_active = ticks_ms()
+        self._raw_bytes += length
+        return await self._send_queue.write_now(frame_view(buf, length, OP_BYTES if binary else OP_TEXT))
+
+    # 送信キューの状態
+    # queue_depth: 未送信のフレーム数, dropped_frames: 破棄したフレーム数
+    # sent_bytes: 送信したバイト数(フレームヘッダ含む), raw_bytes: 圧縮前のペイロードのバイト数
+    # deflate_frames: 圧縮したフレーム数, deflate_us: 圧縮に要した時間(マイクロ秒)
+    def stats(self):
+        result = self._send_queue.stats()
+        result['raw_bytes'] = self._raw_bytes
+        result['deflate_frames'] = self._deflate_frames
+        result['deflate_us'] = self._deflate_us
+        return result
+
+    # 送信データをフレーム化する
+    # permessage-deflate が有効で、閾値以上のペイロードは圧縮する
+    # return: (header, payload)
+    def _frame(self, data):
+        opcode, payload = payload_of(data)
+        length = buffer_len(payload)
+        self._raw_bytes += length
+        deflate = self._websocket.deflate
+        if deflate and length >= self.deflate_threshold:
+            start = ticks_us()
+            compressed = deflate.compress(payload)
+            self._deflate_us += ticks_diff(ticks_us(), start)
+            # 圧縮しても小さくならない場合はそのまま送信する
+            if len(compressed) < length:
+                self._deflate_frames += 1
+                return (frame_header(opcode, len(compressed), rsv1=True), compressed)
+        return (frame_header(opcode, length), payload)
+
+    # トピックを購読する
+    # webserver.hub.publish(topic, data) で配信されたデータがこの接続に送信される
+    def subscribe(self, topic):
+        self.server.hub.subscribe(topic, self)
+
+    # トピックの購読を解除する
+    def unsubscribe(self, topic):
+        self.server.hub.unsubscribe(topic, self)
+
+    # ハブで同じフレームを共有する接続の種類
+    # 圧縮の有無とウィンドウサイズが同じ接続は、同じフレームを共有できる
+    def _hub_kind(self):
+        deflate = self._websocket.deflate
+        return f'ws-deflate{deflate.server_wbits}' if deflate else 'ws'
+
+    # ハブから配信するデータをフレーム化する (event, id は使用しない)
+    def _hub_frame(self, data, event=None, id=None):
+        return self._frame(data)
+
+    # ハブのスケジューラから定期的に呼び出される死活確認
+    # PONG はハンドラが受信している間にしか読み込めないため、PONG の期限は受信を待っている間だけ確認する
+    # 送信のみのハンドラ (受信していない接続) は、PING も送信キューから送り、
+    # 送信に失敗した場合や drain が pong_ms を超えて終わらない場合 (相手が応答しない) に切断する
+    # now: 現在時刻 (ticks_ms)
+    # hub: TMiniHub (ping_ms, pong_ms, idle_ms の設定値を参照する)
+    def _keepalive(self, now, hub):
+        if self.is_closed():
+            return
+        ws = self._websocket
+        queue = self._send_queue
+        if hub.idle_ms and ticks_diff(now, self._last_active) > hub.idle_ms:
+            LOGGER.info('WebSocket idle timeout.')
+            self._abort(CLOSE_GOING_AWAY)
+        elif queue.closed or (queue.drain_since is not None and ticks_diff(now, queue.drain_since) > hub.pong_ms):
+            LOGGER.info('WebSocket send stalled.')
+            self._abort(CLOSE_GOING_AWAY)
+        elif ws.ping_sent is not None and ws.reading:
+            if ticks_diff(now, ws.ping_sent) > hub.pong_ms:
+                LOGGER.info('WebSocket pong timeout.')
+                self._abort(CLOSE_GOING_AWAY)
+        elif (hub.ping_ms and ticks_diff(now, ws.last_rx) >= hub.ping_ms
+                and (ws.ping_sent is None or ticks_diff(now, ws.ping_sent) >= hub.ping_ms)):
+            if queue.offer(_PING_FRAME):
+                ws.ping_sent = now
+                queue.kick()
+
+    # 応答のないクライアントを切断する
+    # ストリームも閉じて、受信待ちのハンドラを起こす
+    def _abort(self, code):
+        try:
+            self._websocket.close(code=code)
+        except Exception:
+            pass
+        self._send_queue.close()
+        try:
+            self.response._writer.close()
+        except Exception:
+            pass
+
+    # ハブが遅い購読者として切断する
+    def _evict(self):
+        self._abort(CLOSE_POLICY_VIOLATION)
+
+    # 送信キューが溢れた場合に切断する
+    def _on_overflow_close(self):
+        self._websocket.close(code=CLOSE_POLICY_VIOLATION)
 
     # webscoket コネクション確立の応答を返す
     #
@@ -63,11 +216,18 @@ class TMiniWebSocket(TMiniRouter):
     # Upgrade: websocket
     # Connection: upgrade
     # Sec-Websocket-Accept: xxxx
+    # Sec-Websocket-Extensions: permessage-deflate; ... (クライアントが提案した場合)
     async def _send_upgrade_response(self, key):
         self.response._write_status_code(HttpStatusCode.SWITCH_PROTOCOLS)
         self.response._write_header('upgrade', 'websocket')
         self.response._write_header('connection', 'upgrade')
         self.response._write_header('sec-websocket-accept', self._res_key(key))
+        if self.deflate_enabled:
+            offer = self.request._headers.get('sec-websocket-extensions', None)
+            deflate, extension = tminiwsdeflate.negotiate(offer, self.deflate_wbits)
+            if deflate:
+                self._websocket.deflate = deflate
+                self.response._write_header('sec-websocket-extensions', extension)
         await self.response._drain("\r\n")
 
     # RFC 6455 Sec-WebSocket-Accept
@@ -0,0 +1,123 @@
+import uasyncio as asyncio
+from . import logging
+
+try:
+    import _thread
+except ImportError:
+    _thread = None      # スレッドに対応していないポート
+
+LOGGER = logging.getLogger(__name__)
+
+# ワーカースレッドを使えるかどうか (使えない場合は run がイベントループ上でそのまま実行する)
+AVAILABLE = _thread is not None
+
+# ワーカースレッドで実行する処理
+class _Job:
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = asyncio.ThreadSafeFlag()    # ワーカースレッドから完了を通知する
+
+    # ワーカースレッドで実行する
+    def execute(self):
+        try:
+            self.result = self.func(*self.args)
+        except Exception as ex:
+            self.error = ex
+        self.done.set()
+
+# 時間のかかる処理をイベントループとは別のスレッド (RP2040 では2つ目のコア) で実行するワーカー
+# ジョブのキューはロックで保護し、ワーカースレッドはジョブが来るまでロックで待つ (ビジーウェイトしない)
+# イベントループ側は ThreadSafeFlag で完了を待つため、待っている間も他の接続を処理できる
+class TMiniWorker:
+    max_jobs = 8    # 実行待ち・実行中のジョブの上限 (超えた場合は空きができるまで待つ)
+
+    def __init__(self):
+        self._lock = None       # _jobs を保護する
+        self._wake = None       # ロック中: 新しいジョブがない (ワーカースレッドは acquire で待つ)
+        self._jobs = []
+        self._pending = 0               # 実行待ち・実行中のジョブ数 (イベントループ側でのみ更新する)
+        self._space = None              # ジョブの完了を通知する Event
+        self._started = False
+        self._stopped = False
+        self.completed = 0              # 完了したジョブ数
+
+    # ワーカースレッドを起動する (初めて run を呼び出した時に自動で起動する)
+    def start(self):
+        if self._started or self._stopped or not AVAILABLE:
+            return
+        self._started = True
+        self._lock = _thread.allocate_lock()
+        self._wake = _thread.allocate_lock()
+        self._wake.acquire()
+        _thread.start_new_thread(self._thread_proc, ())
+        LOGGER.info('worker thread started')
+
+    # ワーカースレッドを停止する (実行待ちのジョブを処理してから終了する)
+    # RP2040 では同時に起動できるスレッドが1つのため、停止後は再開できない
+    def stop(self):
+        if self._started and not self._stopped:
+            self._stopped = True
+            self._push(None)
+
+    # 関数をワーカースレッドで実行し、完了を待つ
+    # func: 実行する関数 (async 関数は不可. uasyncio のオブジェクトを操作しないこと)
+    # args: 関数の引数
+    # return: 関数の戻り値 (関数が例外を投げた場合は、その例外を投げる)
+    async def run(self, func, *args):
+        if self._stopped:
+            raise RuntimeError('worker stopped')
+        if not AVAILABLE:
+            self.completed += 1
+            return func(*args)
+        if self._space is None:
+            self._space = asyncio.Event()
+        while self._pending >= self.max_jobs:
+            self._space.clear()
+            await self._space.wait()
+
+        self.start()
+        job = _Job(func, args)
+        self._pending += 1
+        try:
+            self._push(job)
+            await job.done.wait()
+        finally:
+            self._pending -= 1
+            self._space.set()
+        self.completed += 1
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    # 統計情報
+    def stats(self):
+        return {
+            'pending': self._pending,
+            'completed': self.completed,
+        }
+
+    # ジョブをキューに追加してワーカースレッドを起こす
+    # ロックを解放するのはイベントループ側だけ、取得するのはワーカースレッドだけなので、二重に解放することはない
+    def _push(self, job):
+        with self._lock:
+            self._jobs.append(job)
+        if self._wake.locked():
+            self._wake.release()
+
+    # ワーカースレッドの処理
+    def _thread_proc(self):
+        while True:
+            self._wake.acquire()
+            while True:
+                with self._lock:
+                    if not self._jobs:
+                        break
+                    job = self._jobs.pop(0)
+                if job is None:
+                    LOGGER.info('worker thread stopped')
+                    return
+                job.execute()
@@ -0,0 +1,137 @@
+"""
+permessage-deflate extension (RFC 7692)
+"""
+import io
+from . import logging
+
+try:
+    import deflate      # MicroPython 1.21 以降
+    zlib = None
+except ImportError:
+    deflate = None
+    try:
+        import zlib     # CPython
+    except ImportError:
+        zlib = None
+
+LOGGER = logging.getLogger(__name__)
+
+EXTENSION_NAME = 'permessage-deflate'
+_TAIL = b'\x00\x00\xff\xff'
+_MIN_WBITS = 9
+_MAX_WBITS = 15
+
+# 圧縮に対応しているかどうか
+# MicroPython は MICROPY_PY_DEFLATE_COMPRESS が有効なポートのみ圧縮できる
+def _check_available():
+    try:
+        if deflate:
+            with deflate.DeflateIO(io.BytesIO(), deflate.RAW, _MIN_WBITS) as f:
+                f.write(b'x')
+            return True
+        return zlib is not None
+    except Exception:
+        return False
+
+AVAILABLE = _check_available()
+
+# 接続毎の permessage-deflate の設定
+# コンテキストを引き継がない (no_context_takeover) ため、メッセージ毎に独立して圧縮/伸長する
+class TMiniDeflate:
+
+    # コンストラクタ
+    # server_wbits: 送信時の圧縮ウィンドウサイズ(2^n バイト)
+    # client_wbits: 受信時の伸長ウィンドウサイズ(2^n バイト)
+    def __init__(self, server_wbits, client_wbits):
+        self.server_wbits = server_wbits
+        self.client_wbits = client_wbits
+
+    # ペイロードを圧縮する
+    # 末尾の 0x00 0x00 0xff 0xff は取り除く (RFC 7692 7.2.1)
+    def compress(self, data):
+        if deflate:
+            buf = io.BytesIO()
+            with deflate.DeflateIO(buf, deflate.RAW, self.server_wbits) as f:
+                f.write(data)
+            data = buf.getvalue()
+        else:
+            c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -self.server_wbits)
+            data = c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH)
+        if data[-4:] == _TAIL:
+            data = data[:-4]
+        return data
+
+    # ペイロードを伸長する
+    # max_size: 伸長後の最大サイズ. 超える場合は ValueError
+    def decompress(self, data, max_size):
+        data = bytes(data) + _TAIL
+        if deflate:
+            with deflate.DeflateIO(io.BytesIO(data), deflate.RAW, self.client_wbits) as f:
+                data = f.read(max_size + 1)
+        else:
+            data = zlib.decompressobj(-self.client_wbits).decompress(data, max_size + 1)
+        if len(data) > max_size:
+            raise ValueError('message too big')
+        return data
+
+# Sec-WebSocket-Extensions ヘッダから permessage-deflate の提案を取り出す
+# return: パラメータの辞書 / 提案がない場合は None
+def parse_offer(header):
+    if not header:
+        return None
+    for offer in header.split(','):
+        params = [p.strip() for p in offer.split(';')]
+        if params[0].lower() != EXTENSION_NAME:
+            continue
+        result = {}
+        for p in params[1:]:
+            kv = p.split('=', 1)
+            result[kv[0].strip().lower()] = kv[1].strip().strip('"') if len(kv) > 1 else None
+        return result
+    return None
+
+# permessage-deflate をネゴシエートする
+# header: クライアントの Sec-WebSocket-Extensions ヘッダの値
+# wbits : サーバが使用するウィンドウサイズの上限
+# return: (TMiniDeflate, 応答ヘッダの値) / 受け付けない場合は (None, None)
+def negotiate(header, wbits):
+    if not AVAILABLE:
+        return None, None
+    offer = parse_offer(header)
+    if offer is None:
+        return None, None
+
+    wbits = max(_MIN_WBITS, min(_MAX_WBITS, wbits))
+    response = EXTENSION_NAME + '; server_no_context_takeover; client_no_context_takeover'
+
+    # クライアントのウィンドウサイズを制限できない場合は、伸長に 32KB 必要になるため受け付けない
+    # 値付きで提案された場合は、それより大きな値を返してはならない (RFC 7692 7.1.2.2)
+    client_wbits = _MAX_WBITS
+    if 'client_max_window_bits' in offer:
+        client_wbits = wbits
+        if offer['client_max_window_bits']:
+            try:
+                offered = int(offer['client_max_window_bits'])
+            except ValueError:
+                return None, None
+            if not 8 <= offered <= _MAX_WBITS:
+                return None, None
+            client_wbits = min(wbits, offered)
+        response += f'; client_max_window_bits={client_wbits}'
+        # 8 の場合も 9 のウィンドウで伸長できる (大きなウィンドウは小さなウィンドウの圧縮データを伸長できる)
+        client_wbits = max(_MIN_WBITS, client_wbits)
+    elif wbits < _MAX_WBITS:
+        LOGGER.debug('permessage-deflate declined. (client_max_window_bits not offered)')
+        return None, None
+
+    server_wbits = wbits
+    if offer.get('server_max_window_bits', None):
+        try:
+            server_wbits = min(wbits, int(offer['server_max_window_bits']))
+        except ValueError:
+            return None, None
+        if server_wbits < _MIN_WBITS:
+            return None, None
+        response += f'; server_max_window_bits={server_wbits}'
+
+    return TMiniDeflate(server_wbits, client_wbits), response
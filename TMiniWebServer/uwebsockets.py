@@ -8,6 +8,7 @@ import ure as re
 import ustruct as struct
 import urandom as random
 from ucollections import namedtuple
+from time import ticks_ms
 
 LOGGER = logging.getLogger(__name__)
 
@@ -30,6 +31,9 @@ CLOSE_TOO_BIG            = const(1009)
 CLOSE_MISSING_EXTN       = const(1010)
 CLOSE_BAD_CONDITION      = const(1011)
 
+# サーバ側フレームヘッダの最大長 (send_into 用バッファの先頭に確保する領域)
+FRAME_HEADROOM = const(10)
+
 URL_RE = re.compile(r'(wss|ws)://([A-Za-z0-9-\.]+)(?:\:([0-9]+))?(/.+)?')
 URI = namedtuple('URI', ('protocol', 'hostname', 'port', 'path'))
 
@@ -60,17 +64,128 @@ def urlparse(uri):
         return URI(protocol, host, int(port), path)
 
 
+# フレームヘッダを生成する
+# opcode: OP_XXX
+# length: ペイロードのバイト数
+# fin   : 最後のフレームかどうか
+# mask  : マスクビットを立てるかどうか(マスク値自体は含まない)
+# rsv1  : RSV1 ビット (permessage-deflate で圧縮したメッセージの先頭フレーム)
+def frame_header(opcode, length, fin=True, mask=False, rsv1=False):
+    """
+    Build a frame header.
+    See https://tools.ietf.org/html/rfc6455#section-5.2 for the details.
+    """
+    # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
+    byte1 = 0x80 if fin else 0
+    byte1 |= 0x40 if rsv1 else 0
+    byte1 |= opcode
+
+    # Byte 2: MASK(1) LENGTH(7)
+    byte2 = 0x80 if mask else 0
+
+    if length < 126:  # 126 is magic value to use 2-byte length header
+        return struct.pack('!BB', byte1, byte2 | length)
+    elif length < (1 << 16):  # Length fits in 2-bytes
+        return struct.pack('!BBH', byte1, byte2 | 126, length)
+    elif length < (1 << 64):
+        return struct.pack('!BBQ', byte1, byte2 | 127, length)
+    else:
+        raise ValueError()
+
+# フレームヘッダをバッファに書き込む (メモリを確保しない)
+# buf   : 書き込み先のバッファ
+# end   : ヘッダの末尾の位置 (ペイロードの先頭)
+# return: ヘッダの先頭の位置
+def frame_header_into(buf, end, opcode, length, fin=True, rsv1=False):
+    byte1 = (0x80 if fin else 0) | (0x40 if rsv1 else 0) | opcode
+    if length < 126:
+        start = end - 2
+        struct.pack_into('!BB', buf, start, byte1, length)
+    elif length < (1 << 16):
+        start = end - 4
+        struct.pack_into('!BBH', buf, start, byte1, 126, length)
+    else:
+        start = end - 10
+        struct.pack_into('!BBQ', buf, start, byte1, 127, length)
+    return start
+
+# send_into 用のバッファにヘッダを書き込み、フレーム全体の memoryview を返す
+def frame_view(buf, length, opcode=OP_BYTES):
+    buffer_len(buf)     # 1バイト単位のバッファかどうか確認する
+    start = frame_header_into(buf, FRAME_HEADROOM, opcode, length)
+    return memoryview(buf)[start:FRAME_HEADROOM + length]
+
+# send_into 用のバッファを確保する
+# ペイロードは buf[FRAME_HEADROOM:FRAME_HEADROOM + size] に書き込む
+def frame_buffer(size):
+    return bytearray(FRAME_HEADROOM + size)
+
+# memoryview の要素のバイト数
+# memoryview.itemsize のないポート (rp2 など多くのポート) では、1要素をコピーしてバイト数を調べる
+def _itemsize(mv):
+    size = getattr(mv, 'itemsize', None)
+    if size is None:
+        size = len(bytes(mv[:1])) if len(mv) else 1
+    return size
+
+# バッファのバイト数
+# ペイロードは1バイト単位のバッファ (bytes, bytearray, array('B'), それらの memoryview) に限る
+# array('h') などは要素数とバイト数が異なり、memoryview.itemsize のないポートでは正しい長さを得られないため TypeError とする
+def buffer_len(buf):
+    if isinstance(buf, (bytes, bytearray)):
+        return len(buf)
+    mv = memoryview(buf)
+    if _itemsize(mv) != 1:
+        raise TypeError('payload must be a byte buffer (bytes, bytearray, array("B"))')
+    return len(mv)
+
+# 送信データから opcode とペイロードを決定する
+# str は OP_TEXT (UTF-8), 1バイト単位のバッファ(bytes, bytearray, array('B'), memoryview)はコピーせずに OP_BYTES
+def payload_of(buf):
+    if isinstance(buf, str):
+        return OP_TEXT, buf.encode('utf-8')
+    elif isinstance(buf, (bytes, bytearray)):
+        return OP_BYTES, buf
+    try:
+        buffer_len(buf)
+    except TypeError as ex:
+        raise TypeError(f'unsupported payload type ({ex})')
+    return OP_BYTES, buf
+
+
+# バッファの指定範囲のマスクを解除する (その場で書き換える)
+def _unmask(buf, pos, length, mask_bits):
+    for i in range(length):
+        buf[pos + i] ^= mask_bits[i & 3]
+
+
 class Websocket:
     """
     Basis of the Websocket protocol.
     """
     is_client = False
+    max_message_size = 16 * 1024   # recv() で結合するメッセージ・伸長したメッセージの最大サイズ (recv_fragment の断片には適用しない)
+    recv_buffer_size = 512         # 受信バッファのサイズ
 
     def __init__(self, sock=None, reader=None, writer=None):
         self.sock = sock
         self.reader = reader
         self.writer = writer
         self.open = True
+        self._rbuf = bytearray(self.recv_buffer_size)   # 受信バッファ (接続毎に再利用する)
+        self._rmv = memoryview(self._rbuf)
+        self._rpos = 0               # 受信バッファの未処理データの先頭
+        self._rend = 0               # 受信バッファの未処理データの末尾
+        self._eof = False            # 相手が切断したかどうか
+        self._frag_opcode = None     # 受信中の断片化メッセージの opcode
+        self._frag_size = 0          # 受信済みの断片の合計サイズ
+        self._frag_buf = None        # 圧縮されたメッセージの断片を結合するバッファ
+        self._limit_size = False     # recv() で結合中 (max_message_size を適用する)
+        self._rsv1 = False           # 最後に読み込んだフレームの RSV1 ビット
+        self.deflate = None          # permessage-deflate の設定 (TMiniDeflate)
+        self.last_rx = ticks_ms()    # 最後にフレームを受信した時刻
+        self.ping_sent = None        # 応答待ちの PING を送信した時刻
+        self.reading = False         # recv_fragment で受信を待っているかどうか (PONG を読み込めるのはこの間だけ)
 
     def __enter__(self):
         return self
@@ -88,14 +203,77 @@ class Websocket:
         except:
             pass
 
-    # バイトデータを読み込む
-    async def _read(self, length):
+    # ソケットから受信バッファの空き領域へ読み込む
+    # return: 読み込んだバイト数 / 0: EOF / None: 読み込めるデータがない(ノンブロッキングのソケット)
+    async def _fill(self):
+        # 未処理のデータを先頭に詰める
+        remain = self._rend - self._rpos
+        if remain == 0:
+            self._rpos = self._rend = 0
+        elif self._rpos > 0:
+            self._rbuf[:remain] = self._rbuf[self._rpos:self._rend]
+            self._rpos, self._rend = 0, remain
+
+        free = self._rmv[self._rend:]
         if self.sock:
-            return self.sock.read(length)
+            n = self.sock.readinto(free)
+        elif self.reader and hasattr(self.reader, 'readinto'):
+            n = await self.reader.readinto(free)
         elif self.reader:
-            return await self.reader.read(length)
+            data = await self.reader.read(len(free))
+            n = len(data)
+            free[:n] = data
         else:
-            return b''
+            n = 0
+        if n:
+            self._rend += n
+        return n
+
+    # 受信バッファに n バイト以上のデータが溜まるまで読み込む
+    # n は受信バッファのサイズ以下であること
+    # return: 溜まったかどうか (途中で EOF になった場合は False)
+    async def _ensure(self, n):
+        while self._rend - self._rpos < n:
+            r = await self._fill()
+            if r is None:
+                raise NoDataException
+            if r == 0:
+                return False
+        return True
+
+    # 受信バッファを経由して、ちょうど length バイトを読み込む
+    # 受信バッファより大きい場合は、専用のバッファ(bytearray)へ直接読み込む
+    # mask_bits: 指定された場合はマスクを解除する
+    async def _read_exact(self, length, mask_bits=None):
+        if length <= len(self._rbuf):
+            if not await self._ensure(length):
+                raise ValueError('truncated frame')
+            pos = self._rpos
+            if mask_bits:
+                _unmask(self._rbuf, pos, length, mask_bits)
+            self._rpos += length
+            return bytes(self._rmv[pos:pos + length])
+
+        data = bytearray(length)
+        view = memoryview(data)
+        got = self._rend - self._rpos
+        view[:got] = self._rmv[self._rpos:self._rend]
+        self._rpos = self._rend = 0
+        while got < length:
+            if self.sock:
+                n = self.sock.readinto(view[got:])
+            elif hasattr(self.reader, 'readinto'):
+                n = await self.reader.readinto(view[got:])
+            else:
+                chunk = await self.reader.read(length - got)
+                n = len(chunk)
+                view[got:got + n] = chunk
+            if not n:
+                raise ValueError('truncated frame')
+            got += n
+        if mask_bits:
+            _unmask(data, 0, length, mask_bits)
+        return data
 
     # バイトデータを書き込む
     def _write(self, length):
@@ -107,52 +285,71 @@ class Websocket:
             pass
 
     # フレームを読み込む
+    # ソケットからは受信バッファ単位でまとめて読み込み、バッファに溜まっているフレームはそのまま取り出す
     async def read_frame(self):
         """
         Read a frame from the socket.
         See https://tools.ietf.org/html/rfc6455#section-5.2 for the details.
         """
-        LOGGER.debug("read_frame start")
-
         # Frame header
-        two_bytes = await self._read(2)
-        if not two_bytes:
-            LOGGER.debug(f"two_bytes={two_bytes}")
-            raise NoDataException
-
-        byte1, byte2 = struct.unpack('!BB', two_bytes)[0:2]
-
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
+        if not await self._ensure(2):
+            if self._rpos == self._rend:
+                # フレームの境界で EOF
+                self._eof = True
+                raise NoDataException
+            raise ValueError('truncated frame')
+        self.last_rx = ticks_ms()
+
+        buf = self._rbuf
+        pos = self._rpos
+        byte1 = buf[pos]
+        byte2 = buf[pos + 1]
+
+        # Byte 1: FIN(1) RSV1(1) _(1) _(1) OPCODE(4)
         fin = bool(byte1 & 0x80)
         opcode = byte1 & 0x0f
-        LOGGER.debug(f"fin={fin}, opcode={opcode}")
+        self._rsv1 = bool(byte1 & 0x40)
 
         # Byte 2: MASK(1) LENGTH(7)
         mask = bool(byte2 & (1 << 7))
         length = byte2 & 0x7f
-        LOGGER.debug(f"mask={mask}, length={length}")
 
+        header_len = 2
         if length == 126:  # Magic number, length header is 2 bytes
-            length, = struct.unpack('!H', await self._read(2))
+            header_len = 4
         elif length == 127:  # Magic number, length header is 8 bytes
-            length, = struct.unpack('!Q', await self._read(8))
-        LOGGER.debug(f"length_ext={length}")
-
-        # Mask is 4 bytes
-        mask_bits = await self._read(4) if mask else b''
-        LOGGER.debug(f"mask_bits={mask_bits}")
+            header_len = 10
+        if mask:  # Mask is 4 bytes
+            header_len += 4
+        if not await self._ensure(header_len):
+            raise ValueError('truncated frame')
+
+        buf = self._rbuf
+        pos = self._rpos
+        if length == 126:
+            length, = struct.unpack_from('!H', buf, pos + 2)
+        elif length == 127:
+            length, = struct.unpack_from('!Q', buf, pos + 2)
+        mask_bits = bytes(buf[pos + header_len - 4:pos + header_len]) if mask else None
+        self._rpos = pos + header_len
+        LOGGER.debug(f"read_frame: fin={fin}, opcode={opcode}, mask={mask}, length={length}")
+
+        # recv() で結合するメッセージと圧縮されたメッセージは、断片の合計が上限を超える場合にペイロードを読まずに切断する
+        # (recv_fragment で断片ごとに受け取る場合は、メッセージ全体のサイズを制限しない)
+        if (opcode < OP_CLOSE and (self._limit_size or self._rsv1 or self._frag_buf is not None)
+                and self._frag_size + length > self.max_message_size):
+            LOGGER.debug("Message of length %s too big. Closing", self._frag_size + length)
+            self.close(code=CLOSE_TOO_BIG)
+            return True, OP_CLOSE, b''
 
         try:
-            data = await self._read(length)
+            data = await self._read_exact(length, mask_bits)
         except MemoryError:
             # We can't receive this many bytes, close the socket
             LOGGER.debug("Frame of length %s too big. Closing", length)
             self.close(code=CLOSE_TOO_BIG)
             return True, OP_CLOSE, b''
 
-        if mask:
-            data = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(data))
-
         return fin, opcode, data
 
     # フレームを書き出す
@@ -162,43 +359,25 @@ class Websocket:
         See https://tools.ietf.org/html/rfc6455#section-5.2 for the details.
         """
         LOGGER.debug("write_frame start")
-        fin = True
         mask = self.is_client  # messages sent by client are masked
-        length = len(data)
-        LOGGER.debug(f"fin={fin}, mask={mask}")
-        LOGGER.debug(f"data={data}, length={length}")
+        length = buffer_len(data)
+        LOGGER.debug(f"write_frame: opcode={opcode}, mask={mask}, length={length}")
 
-        # Frame header
-        # Byte 1: FIN(1) _(1) _(1) _(1) OPCODE(4)
-        byte1 = 0x80 if fin else 0
-        byte1 |= opcode
-
-        # Byte 2: MASK(1) LENGTH(7)
-        byte2 = 0x80 if mask else 0
-
-        if length < 126:  # 126 is magic value to use 2-byte length header
-            byte2 |= length
-            self._write(struct.pack('!BB', byte1, byte2))
-
-        elif length < (1 << 16):  # Length fits in 2-bytes
-            byte2 |= 126  # Magic code
-            self._write(struct.pack('!BBH', byte1, byte2, length))
-
-        elif length < (1 << 64):
-            byte2 |= 127  # Magic code
-            self._write(struct.pack('!BBQ', byte1, byte2, length))
-
-        else:
-            raise ValueError()
+        self._write(frame_header(opcode, length, mask=mask))
 
         if mask:  # Mask is 4 bytes
             mask_bits = struct.pack('!I', random.getrandbits(32))
             self._write(mask_bits)
 
-            data = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(data))
+            data = bytes(b ^ mask_bits[i % 4] for i, b in enumerate(bytes(data)))
 
         self._write(data)
 
+    # 書き込んだデータをクライアントへ送出する
+    async def drain(self):
+        if self.writer:
+            await self.writer.drain()
+
     # データを受信する
     async def recv(self):
         """
@@ -208,31 +387,95 @@ class Websocket:
         fire off a routine to process frames and put the data in a queue.
         If you don't call recv() sufficiently often you won't process control
         frames.
+
+        Fragmented messages are reassembled up to max_message_size bytes.
+        """
+        buf = None
+        self._limit_size = True
+        try:
+            while self.open:
+                frame = await self.recv_fragment()
+                if not frame:
+                    return frame
+                opcode, data, fin = frame
+                if buf is None:
+                    if fin:
+                        return data.decode('utf-8') if opcode == OP_TEXT else data
+                    buf = bytearray(data)
+                else:
+                    buf.extend(data)
+                if fin:
+                    return bytes(buf).decode('utf-8') if opcode == OP_TEXT else bytes(buf)
+        finally:
+            self._limit_size = False
+
+    # データフレームを断片ごとに受信する
+    # 制御フレーム(PING/PONG/CLOSE)は断片の間に挟まっていても内部で処理する
+    # return: (opcode, data, fin) / 切断時は None
+    #  opcode: メッセージの opcode (OP_TEXT or OP_BYTES). 継続フレームでも先頭フレームの値
+    #  data  : 断片のバイトデータ (テキストの場合も bytes)
+    #  fin   : メッセージの最後の断片かどうか
+    async def recv_fragment(self):
         """
+        Receive the next data fragment from the websocket.
 
+        Unlike recv() the message is not buffered, so large messages can be
+        consumed with constant memory. Compressed (permessage-deflate)
+        messages are returned as a single decompressed fragment.
+        """
+        # 受信していない間に送った PING の PONG は、まだ読まれずにソケットに残っているため応答待ちにしない
+        self.ping_sent = None
+        self.reading = True
+        try:
+            return await self._recv_fragment()
+        finally:
+            self.reading = False
+
+    async def _recv_fragment(self):
         while self.open:
             try:
                 fin, opcode, data = await self.read_frame()
-                LOGGER.debug("recv: fin={fin}, opcode={opcode}, data={data}")
+                LOGGER.debug(f"recv: fin={fin}, opcode={opcode}, data={data}")
             except NoDataException:
+                # EOF の場合は切断済みとする
+                if self._eof:
+                    self._close()
                 return ''
             except ValueError:
                 LOGGER.debug("Failed to read frame. Socket dead.")
                 self._close()
                 raise ConnectionClosed()
 
-            if not fin:
-                raise NotImplementedError()
-
-            if opcode == OP_TEXT:
-                return data.decode('utf-8')
-            elif opcode == OP_BYTES:
-                return data
+            if opcode == OP_TEXT or opcode == OP_BYTES:
+                if self._frag_opcode is not None:
+                    # 断片化メッセージの途中で新しいメッセージは開始できない
+                    self.close(code=CLOSE_PROTOCOL_ERROR)
+                    return None
+                if self._rsv1:
+                    if not self.deflate:
+                        self.close(code=CLOSE_PROTOCOL_ERROR)
+                        return None
+                    self._frag_buf = bytearray()
+                if not fin:
+                    self._frag_opcode = opcode
+                    self._frag_size = len(data)
+            elif opcode == OP_CONT:
+                # This is a continuation of a previous frame
+                opcode = self._frag_opcode
+                if opcode is None or self._rsv1:
+                    self.close(code=CLOSE_PROTOCOL_ERROR)
+                    return None
+                if fin:
+                    self._frag_opcode = None
+                    self._frag_size = 0
+                else:
+                    self._frag_size += len(data)
             elif opcode == OP_CLOSE:
                 self._close()
-                return
+                return None
             elif opcode == OP_PONG:
                 # Ignore this frame, keep waiting for a data frame
+                self.ping_sent = None
                 continue
             elif opcode == OP_PING:
                 # We need to send a pong frame
@@ -240,26 +483,47 @@ class Websocket:
                 self.write_frame(OP_PONG, data)
                 # And then wait to receive
                 continue
-            elif opcode == OP_CONT:
-                # This is a continuation of a previous frame
-                raise NotImplementedError(opcode)
             else:
                 raise ValueError(opcode)
 
+            if self._frag_buf is None:
+                return opcode, data, fin
+
+            # 圧縮されたメッセージは全ての断片を受信してから伸長する
+            self._frag_buf.extend(data)
+            if not fin:
+                continue
+            data, self._frag_buf = self._frag_buf, None
+            try:
+                return opcode, self.deflate.decompress(data, self.max_message_size), True
+            except (MemoryError, ValueError):
+                self.close(code=CLOSE_TOO_BIG)
+            except Exception:
+                self.close(code=CLOSE_BAD_DATA)
+            return None
+        return None
+
     # データを送信する
     def send(self, buf):
         """Send data to the websocket."""
-
-        if isinstance(buf, str):
-            opcode = OP_TEXT
-            buf = buf.encode('utf-8')
-        elif isinstance(buf, bytes):
-            opcode = OP_BYTES
-        else:
-            raise TypeError()
-
+        opcode, buf = payload_of(buf)
         self.write_frame(opcode, buf)
 
+    # 呼び出し側が確保したバッファからフレームを送信する
+    # buf   : frame_buffer() で確保したバッファ. ペイロードは buf[FRAME_HEADROOM:] に書き込んでおく
+    # length: ペイロードのバイト数
+    # ヘッダはバッファの先頭の領域に書き込み、ヘッダとペイロードをコピーせずに1度で書き込む
+    def send_into(self, buf, length, opcode=OP_BYTES):
+        """Send a frame whose payload was written at buf[FRAME_HEADROOM:]."""
+        if self.is_client:
+            raise ValueError('send_into is not supported for masked frames')
+        self._write(frame_view(buf, length, opcode))
+
+    # 死活確認の PING を送信する
+    def ping(self, data=b''):
+        self.ping_sent = ticks_ms()
+        self.write_frame(OP_PING, data)
+
     # opcode を書き込んでソケットを閉じる
     def close(self, code=CLOSE_OK, reason=''):
         """Close the websocket."""
@@ -0,0 +1,56 @@
+# JSON / CBOR / MessagePack のエンコード結果のサイズと時間を比較する
+# 実機 (MicroPython) でもホスト (CPython) でも実行できる
+#   micropython: import bench_codec  (TMiniWebServer と同じ階層に置く)
+#   host       : PYTHONPATH=. python bench/bench_codec.py [サンプル数] [繰り返し回数]
+#                (ustruct など MicroPython のモジュール名で import できる環境が必要)
+import sys
+from json import dumps
+from TMiniWebServer.tminicodec import cbor_dumps, cbor_loads, msgpack_dumps, msgpack_loads
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+# テレメトリを模したデータ
+def make_telemetry(count):
+    return {
+        'device': 'pico-w-01',
+        'interval': 1000,
+        'samples': [{'t': 1700000000 + i, 'temp': 20.0 + (i % 50) * 0.25, 'hum': 40 + i % 20, 'ok': True} for i in range(count)],
+    }
+
+# 1回あたりの平均時間(us)
+def measure(func, data, repeat):
+    start = ticks_us()
+    for _ in range(repeat):
+        func(data)
+    return ticks_diff(ticks_us(), start) // repeat
+
+def run(count=100, repeat=20):
+    data = make_telemetry(count)
+    codecs = (
+        ('json', lambda obj: dumps(obj).encode(), None),
+        ('cbor', cbor_dumps, cbor_loads),
+        ('msgpack', msgpack_dumps, msgpack_loads),
+    )
+    base = None
+    print(f'samples={count} repeat={repeat}')
+    print(f"{'codec':<8}{'bytes':>8}{'ratio':>8}{'encode_us':>12}")
+    for name, encode, decode in codecs:
+        encoded = encode(data)
+        if decode is not None and decode(encoded) != data:
+            print(f'{name}: round trip mismatch')
+        size = len(encoded)
+        if base is None:
+            base = size
+        print(f'{name:<8}{size:>8}{size / base:>8.2f}{measure(encode, data, repeat):>12}')
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,104 @@
+# ソケットを使わずにバイト列を再生する StreamReader / StreamWriter の代わり
+# TMiniRequest や Websocket などに渡して、ホットパスを単体で計測・確認するために使う
+# MicroPython (unix port) でも CPython でも動作する
+
+# 用意したバイト列を読み込ませる読み込みストリーム
+# reset() で同じデータを先頭から再生できるため、繰り返し計測してもデータを作り直さない
+class FakeStreamReader:
+
+    # コンストラクタ
+    # data : 再生するバイト列
+    # chunk: 1回の read / readinto で返す最大バイト数 (None: 制限しない). 細切れに届く場合を再現する
+    def __init__(self, data, chunk=None):
+        self._data = memoryview(bytes(data))
+        self._pos = 0
+        self._chunk = chunk
+
+    # 先頭から再生し直す
+    def reset(self):
+        self._pos = 0
+
+    # 未読のバイト数
+    def remaining(self):
+        return len(self._data) - self._pos
+
+    def _take(self, n):
+        if self._chunk and n > self._chunk:
+            n = self._chunk
+        start = self._pos
+        self._pos = min(len(self._data), start + n)
+        return self._data[start:self._pos]
+
+    async def read(self, n=-1):
+        if n < 0:
+            n = self.remaining()
+        return bytes(self._take(n))
+
+    async def readinto(self, buf):
+        data = self._take(len(buf))
+        n = len(data)
+        buf[:n] = data
+        return n
+
+    async def readexactly(self, n):
+        if self.remaining() < n:
+            raise EOFError
+        data = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return bytes(data)
+
+    async def readline(self):
+        data = self._data
+        end = len(data)
+        i = self._pos
+        while i < end:
+            if data[i] == 0x0a:
+                i += 1
+                break
+            i += 1
+        line = bytes(data[self._pos:i])
+        self._pos = i
+        return line
+
+# 書き込まれたデータを数える(必要なら保持する)書き出しストリーム
+class FakeStreamWriter:
+
+    # コンストラクタ
+    # keep: 書き込まれたデータを保持するかどうか (getvalue() で取得する)
+    def __init__(self, keep=False):
+        self._keep = keep
+        self._buf = bytearray()
+        self.written = 0        # 書き込まれたバイト数
+        self.writes = 0         # write の呼び出し回数
+        self.drains = 0         # drain の呼び出し回数
+        self.closed = False
+
+    def reset(self):
+        self._buf = bytearray()
+        self.written = self.writes = self.drains = 0
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.written += len(data)
+        self.writes += 1
+        if self._keep:
+            self._buf.extend(data)
+
+    async def drain(self):
+        self.drains += 1
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        if name == 'peername':
+            return ('127.0.0.1', 50000)
+        return None
+
+    def getvalue(self):
+        return bytes(self._buf)
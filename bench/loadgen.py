@@ -0,0 +1,321 @@
+# TMiniWebServer の負荷試験 (ホストの CPython で実行する)
+#
+# サーバを起動して全てのシナリオを実行し、結果を JSON に保存する:
+#   python bench/loadgen.py --spawn --out bench_result.json
+# MicroPython の unix port で起動する:
+#   python bench/loadgen.py --spawn --server-cmd "micropython bench/server_app.py {port}"
+# 実行中のサーバ(実機など)に対して実行する:
+#   python bench/loadgen.py --host 192.168.0.10 --port 80 --scenarios params,json_get
+# 前回の結果と比較する:
+#   python bench/loadgen.py --spawn --baseline bench_result_old.json
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import shlex
+import struct
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+##-------------------------------------------------------------------------
+## クライアント
+##-------------------------------------------------------------------------
+
+class Client:
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._ws = None     # WebSocket の接続 (reader, writer)
+
+    # HTTP のリクエストを送り、応答を最後まで読む (サーバは1リクエスト毎に切断する)
+    # return: ステータスコード
+    async def http(self, method, path, body=b'', content_type=None):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            headers = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            if body:
+                headers += f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+            writer.write(headers.encode() + b'\r\n' + body)
+            await writer.drain()
+            status = await asyncio.wait_for(reader.readline(), self.timeout)
+            while await asyncio.wait_for(reader.read(64 * 1024), self.timeout):
+                pass
+            parts = status.split()
+            return int(parts[1]) if len(parts) > 1 else 0
+        finally:
+            writer.close()
+
+    # WebSocket でメッセージを送り、エコーを受け取る
+    # return: 送ったメッセージと同じものが返ってきたかどうか
+    async def ws_echo(self, path, message):
+        if self._ws is None:
+            self._ws = await self._ws_connect(path)
+        reader, writer = self._ws
+        try:
+            writer.write(_ws_frame(message))
+            await writer.drain()
+            data = await asyncio.wait_for(_ws_read(reader), self.timeout)
+            return data == message
+        except Exception:
+            self.close()
+            raise
+
+    async def _ws_connect(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write((f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: Upgrade\r\nUpgrade: websocket\r\n'
+                      f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n').encode())
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.timeout)
+        if b' 101 ' not in header.split(b'\r\n', 1)[0]:
+            writer.close()
+            raise ConnectionError('websocket upgrade failed')
+        return reader, writer
+
+    def close(self):
+        if self._ws:
+            self._ws[1].close()
+            self._ws = None
+
+# クライアントからサーバへのフレーム (マスクあり)
+def _ws_frame(payload, opcode=0x1):
+    mask = os.urandom(4)
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, 0x80 | n)
+    elif n < 0x10000:
+        header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, n)
+    masked = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    return header + mask + masked
+
+async def _ws_read(reader):
+    head = await reader.readexactly(2)
+    n = head[1] & 0x7f
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    return await reader.readexactly(n)
+
+##-------------------------------------------------------------------------
+## シナリオ
+## 1回の操作を行い、成功したかどうかを返す
+##-------------------------------------------------------------------------
+
+_FORM_BODY = '&'.join(f'field{i}=value%20{i}' for i in range(8)).encode()
+_JSON_BODY = json.dumps([{'t': i, 'v': i * 0.5} for i in range(20)]).encode()
+_WS_MESSAGE = b'x' * 64
+
+async def op_static_1k(client):
+    return await client.http('GET', '/static_1k.txt') == 200
+
+async def op_static_16k(client):
+    return await client.http('GET', '/static_16k.txt') == 200
+
+async def op_static_128k(client):
+    return await client.http('GET', '/static_128k.txt') == 200
+
+async def op_params(client):
+    return await client.http('GET', f'/bench/item/{random.randint(1, 9999)}/sensor') == 200
+
+async def op_form(client):
+    return await client.http('POST', '/bench/form', _FORM_BODY, 'application/x-www-form-urlencoded') == 200
+
+async def op_json_get(client):
+    return await client.http('GET', '/bench/json') == 200
+
+async def op_json_post(client):
+    return await client.http('POST', '/bench/json', _JSON_BODY, 'application/json') == 200
+
+async def op_ws_echo(client):
+    return await client.ws_echo('/bench/ws', _WS_MESSAGE)
+
+# 複数のシナリオを重み付きでランダムに混ぜる
+_MIXED = [op_static_1k] * 3 + [op_params] * 2 + [op_json_get] * 2 + [op_form, op_json_post, op_static_16k, op_ws_echo]
+
+async def op_mixed(client):
+    return await random.choice(_MIXED)(client)
+
+SCENARIOS = {
+    'static_1k': op_static_1k,
+    'static_16k': op_static_16k,
+    'static_128k': op_static_128k,
+    'params': op_params,
+    'form': op_form,
+    'json_get': op_json_get,
+    'json_post': op_json_post,
+    'ws_echo': op_ws_echo,
+    'mixed': op_mixed,
+}
+
+##-------------------------------------------------------------------------
+## 計測
+##-------------------------------------------------------------------------
+
+def percentile(values, p):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+# サーバのヒープ使用量 (/bench/mem). 取得できない場合は None
+async def read_heap(host, port, reset=False):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET /bench/mem{'?reset=1' if reset else ''} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(-1), 5)
+        writer.close()
+        return json.loads(data.split(b'\r\n\r\n', 1)[1])
+    except Exception:
+        return None
+
+async def run_scenario(name, args):
+    op = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    await read_heap(args.host, args.port, reset=True)
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        nonlocal errors
+        client = Client(args.host, args.port, args.timeout)
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = await op(client)
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+        finally:
+            client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    heap = await read_heap(args.host, args.port)
+    latencies.sort()
+    total = len(latencies) + errors
+    return {
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': _round(percentile(latencies, 0.50)),
+            'p95': _round(percentile(latencies, 0.95)),
+            'p99': _round(percentile(latencies, 0.99)),
+            'max': _round(latencies[-1] if latencies else None),
+        },
+        'peak_heap': heap['peak'] if heap and heap['peak'] else None,
+    }
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+##-------------------------------------------------------------------------
+## サーバの起動と結果の出力
+##-------------------------------------------------------------------------
+
+def spawn_server(args):
+    if args.server_cmd:
+        cmd = shlex.split(args.server_cmd.format(port=args.port))
+    else:
+        cmd = [sys.executable, os.path.join(BENCH_DIR, 'server_app.py'), str(args.port)]
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(ROOT_DIR, 'host'), ROOT_DIR, env.get('PYTHONPATH', '')])
+    if args.trace_mem:
+        env['TMINI_TRACEMALLOC'] = '1'
+    return subprocess.Popen(cmd, cwd=ROOT_DIR, env=env)
+
+async def wait_server(host, port, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f'GET /bench/mem HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+            await writer.drain()
+            await asyncio.wait_for(reader.read(-1), timeout)
+            writer.close()
+            return True
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(0.1)
+    return False
+
+def print_result(name, result, baseline):
+    lat = result['latency_ms']
+    line = (f"{name:<12}{result['rps']:>9}{lat['p50'] or '-':>9}{lat['p95'] or '-':>9}{lat['p99'] or '-':>9}"
+            f"{result['error_rate']:>8}{result['peak_heap'] or '-':>11}")
+    base = baseline.get(name, None)
+    if base and base['rps']:
+        line += f"{(result['rps'] - base['rps']) / base['rps'] * 100:>+9.1f}%"
+    print(line)
+
+async def main(args):
+    names = list(SCENARIOS) if args.scenarios == 'all' else args.scenarios.split(',')
+    for name in names:
+        if name not in SCENARIOS:
+            raise SystemExit(f'unknown scenario: {name} ({", ".join(SCENARIOS)})')
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['scenarios']
+
+    server = spawn_server(args) if args.spawn or args.server_cmd else None
+    try:
+        if not await wait_server(args.host, args.port):
+            raise SystemExit('server is not running')
+        print(f"{'scenario':<12}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}{'peak_heap':>11}"
+              + (f"{'vs base':>10}" if baseline else ''))
+        results = {}
+        for name in names:
+            results[name] = await run_scenario(name, args)
+            print_result(name, results[name], baseline)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    output = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'server': args.server_cmd or ('cpython' if args.spawn else f'{args.host}:{args.port}'),
+        'duration': args.duration,
+        'concurrency': args.concurrency,
+        'scenarios': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'saved: {args.out}')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='TMiniWebServer load generator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--scenarios', default='all', help=f'comma separated ({", ".join(SCENARIOS)}) or all')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per request')
+    parser.add_argument('--spawn', action='store_true', help='start bench/server_app.py')
+    parser.add_argument('--server-cmd', default=None, help='command to start the server ({port} is replaced)')
+    parser.add_argument('--trace-mem', action='store_true', help='measure peak heap with tracemalloc (CPython server)')
+    parser.add_argument('--baseline', default=None, help='previous result JSON to compare rps with')
+    parser.add_argument('--out', default='bench_result.json', help='result JSON file')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,312 @@
+# ホットパスのマイクロベンチマーク
+# ソケットの代わりに fakes.py のストリームを使い、1回あたりの時間(ticks_us)と確保したメモリ(gc.mem_alloc の差分)を計測する
+#   unix port: micropython bench/micro.py [名前の一部] [-n 回数] [--json 結果.json]
+#   host     : PYTHONPATH=host:. python bench/micro.py [名前の一部] [-n 回数] [--json 結果.json]
+#              (CPython でメモリを計測する場合は TMINI_TRACEMALLOC=1 を指定する.
+#               CPython はすぐに解放するため、確保した量ではなく残った量になる)
+import sys
+
+_root = __file__.rsplit('/', 2)[0] if __file__.count('/') >= 2 else '.'
+for _path in (_root, _root + '/bench'):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+import gc
+import json
+import uasyncio as asyncio
+from time import ticks_us, ticks_diff
+from fakes import FakeStreamReader, FakeStreamWriter
+from TMiniWebServer import TMiniWebServer
+from TMiniWebServer.tminirequest import TMiniRequest
+from TMiniWebServer.tminiresponse import TMiniResponse
+from TMiniWebServer.tminiwebserver_util import TMiniWebServerUtil
+from TMiniWebServer.uwebsockets import Websocket, OP_TEXT
+from TMiniWebServer.tminiworker import TMiniWorker
+from TMiniWebServer.tminiratelimit import TMiniRateLimiter
+from TMiniWebServer.tminicache import TMiniNegativeCache
+
+##-------------------------------------------------------------------------
+## 計測対象
+## setup() は 1回の処理を行う async 関数を返す
+##-------------------------------------------------------------------------
+
+_GET_REQUEST = (b'GET /api/sensor/12/temp?from=10&to=20 HTTP/1.1\r\n'
+                b'Host: 192.168.0.10\r\n'
+                b'User-Agent: Mozilla/5.0 (X11; Linux x86_64)\r\n'
+                b'Accept: application/json\r\n'
+                b'Accept-Encoding: gzip, deflate\r\n'
+                b'Connection: keep-alive\r\n'
+                b'\r\n')
+
+_FORM_BODY = '&'.join(f'field{i}=value%20{i}' for i in range(8)).encode()
+_POST_REQUEST = (b'POST /form HTTP/1.1\r\n'
+                 b'Host: 192.168.0.10\r\n'
+                 b'Content-Type: application/x-www-form-urlencoded\r\n'
+                 b'Content-Length: ' + str(len(_FORM_BODY)).encode() + b'\r\n'
+                 b'\r\n' + _FORM_BODY)
+
+def setup_parse_get():
+    reader = FakeStreamReader(_GET_REQUEST)
+
+    async def op():
+        reader.reset()
+        await TMiniRequest(reader).parse()
+    return op
+
+def setup_parse_form():
+    reader = FakeStreamReader(_POST_REQUEST)
+
+    async def op():
+        reader.reset()
+        await TMiniRequest(reader).parse()
+    return op
+
+# 20個のルートを登録したサーバ
+# combined: ルートを1つの正規表現にまとめて検索する
+def _route_server(combined=False):
+    async def handler(router):
+        pass
+    items = []
+    for i in range(10):
+        items.append((f'/static/page{i}', 'GET', handler, {}))
+        items.append((f'/api/item{i}/<id>/<kind>', 'GET', handler, {}))
+    server = TMiniWebServer(port=0, combined_routes=combined)
+    server._route_handlers = []
+    server._add_route_item(items)
+    return server
+
+def _setup_route(path, combined):
+    server = _route_server(combined)
+
+    async def op():
+        server._get_route_handler(path, 'GET')
+    return op
+
+def setup_route_hit_first():
+    return _setup_route('/static/page0', False)
+
+def setup_route_hit_last():
+    return _setup_route('/api/item9/123/temp', False)
+
+def setup_route_miss():
+    return _setup_route('/index.html', False)
+
+def setup_route_combined_hit_first():
+    return _setup_route('/static/page0', True)
+
+def setup_route_combined_hit_last():
+    return _setup_route('/api/item9/123/temp', True)
+
+def setup_route_combined_miss():
+    return _setup_route('/index.html', True)
+
+def setup_unquote():
+    async def op():
+        TMiniWebServerUtil.unquote('/files/%E3%83%86%E3%82%B9%E3%83%88%20data.txt')
+    return op
+
+def setup_unquote_plain():
+    async def op():
+        TMiniWebServerUtil.unquote('/api/sensor/12/temp')
+    return op
+
+# クライアントから届くマスクされたフレームを並べたストリーム
+def _masked_frames(payload, count):
+    mask = b'\x11\x22\x33\x44'
+    masked = bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+    n = len(payload)
+    if n < 126:
+        header = bytes((0x81, 0x80 | n))
+    else:
+        header = bytes((0x81, 0x80 | 126, n >> 8, n & 0xff))
+    return (header + mask + masked) * count
+
+def _setup_ws_read(size):
+    frames = 16
+    reader = FakeStreamReader(_masked_frames(b'x' * size, frames))
+    ws = Websocket(reader=reader)
+    state = [0]
+
+    async def op():
+        if state[0] == frames:
+            reader.reset()
+            state[0] = 0
+        await ws.read_frame()
+        state[0] += 1
+    return op
+
+def setup_ws_read_frame_small():
+    return _setup_ws_read(32)
+
+def setup_ws_read_frame_1k():
+    return _setup_ws_read(1024)
+
+def _setup_ws_write(size):
+    ws = Websocket(writer=FakeStreamWriter())
+    payload = b'x' * size
+
+    async def op():
+        ws.write_frame(OP_TEXT, payload)
+    return op
+
+def setup_ws_write_frame_small():
+    return _setup_ws_write(32)
+
+def setup_ws_write_frame_1k():
+    return _setup_ws_write(1024)
+
+# ミドルウェアを n 個登録したルートの呼び出し (_fire_route)
+def _setup_dispatch(n):
+    async def handler(router):
+        pass
+
+    async def middleware(router, next):
+        await next(router)
+
+    server = TMiniWebServer(port=0)
+    server._route_handlers = []
+    server._add_route_item([('/api/item', 'GET', handler, {})])
+    for _ in range(n):
+        server.use(middleware)
+    server._compose_middlewares()
+    route = server._route_handlers[0]
+
+    async def op():
+        await server._fire_route(route, None)
+    return op
+
+def setup_dispatch_mw0():
+    return _setup_dispatch(0)
+
+def setup_dispatch_mw1():
+    return _setup_dispatch(1)
+
+def setup_dispatch_mw4():
+    return _setup_dispatch(4)
+
+# ワーカースレッドへ処理を渡して完了を待つまでの往復 (処理自体は空)
+def setup_worker_roundtrip():
+    worker = TMiniWorker()
+
+    def noop():
+        return None
+
+    async def op():
+        await worker.run(noop)
+    return op
+
+# 存在しない静的ファイルへのリクエスト (stat してから 404 / 見つからなかったパスのキャッシュから 404)
+# 20個のルートを登録したサーバで計測する (見つからなかった場合はルートの一覧から 405 かどうかを調べる)
+def _setup_static_miss(cache):
+    server = _route_server()
+    server._wwwroot = '/tmini_bench_none'
+    server.not_found = TMiniNegativeCache(cache)
+    response = TMiniResponse(FakeStreamWriter())
+
+    async def op():
+        await server._response_file(None, response, 'GET', '/favicon.ico')
+    return op
+
+def setup_static_miss():
+    return _setup_static_miss(0)
+
+def setup_static_miss_cached():
+    return _setup_static_miss(32)
+
+# 表が満杯の状態でのトークンの消費 (クライアントを順に切り替える)
+def setup_ratelimit_take():
+    limiter = TMiniRateLimiter(1000, 1000)
+    keys = [f'192.168.0.{i}' for i in range(limiter.table_size)]
+    state = [0]
+
+    async def op():
+        limiter.take(keys[state[0]])
+        state[0] = (state[0] + 1) % len(keys)
+    return op
+
+CASES = (
+    ('parse_get', setup_parse_get),
+    ('parse_form', setup_parse_form),
+    ('route_hit_first', setup_route_hit_first),
+    ('route_hit_last', setup_route_hit_last),
+    ('route_miss', setup_route_miss),
+    ('route_combined_hit_first', setup_route_combined_hit_first),
+    ('route_combined_hit_last', setup_route_combined_hit_last),
+    ('route_combined_miss', setup_route_combined_miss),
+    ('unquote', setup_unquote),
+    ('unquote_plain', setup_unquote_plain),
+    ('ws_read_frame_small', setup_ws_read_frame_small),
+    ('ws_read_frame_1k', setup_ws_read_frame_1k),
+    ('ws_write_frame_small', setup_ws_write_frame_small),
+    ('ws_write_frame_1k', setup_ws_write_frame_1k),
+    ('worker_roundtrip', setup_worker_roundtrip),
+    ('dispatch_mw0', setup_dispatch_mw0),
+    ('dispatch_mw1', setup_dispatch_mw1),
+    ('dispatch_mw4', setup_dispatch_mw4),
+    ('ratelimit_take', setup_ratelimit_take),
+    ('static_miss', setup_static_miss),
+    ('static_miss_cached', setup_static_miss_cached),
+)
+
+##-------------------------------------------------------------------------
+## 計測
+##-------------------------------------------------------------------------
+
+# 1回あたりの時間(us)と確保したメモリ(バイト)を計測する
+# 時間は GC を有効にしたまま n 回、メモリは GC を止めて alloc_n 回実行して計測する
+async def measure(op, n, alloc_n=100):
+    for _ in range(10):
+        await op()
+
+    gc.collect()
+    start = ticks_us()
+    for _ in range(n):
+        await op()
+    us = ticks_diff(ticks_us(), start) / n
+
+    gc.collect()
+    gc.disable()
+    try:
+        before = gc.mem_alloc()
+        for _ in range(alloc_n):
+            await op()
+        alloc = (gc.mem_alloc() - before) / alloc_n
+    finally:
+        gc.enable()
+    return us, alloc
+
+async def run(names, n):
+    results = {}
+    print('{:<26}{:>12}{:>14}'.format('case', 'us/op', 'bytes/op'))
+    for name, setup in CASES:
+        if names and not any(s in name for s in names):
+            continue
+        us, alloc = await measure(setup(), n)
+        results[name] = {'us': round(us, 2), 'alloc': round(alloc, 1)}
+        print('{:<26}{:>12.2f}{:>14.1f}'.format(name, us, alloc))
+    return results
+
+def main(argv):
+    names = []
+    n = 1000
+    out = None
+    i = 0
+    while i < len(argv):
+        if argv[i] == '-n':
+            n = int(argv[i + 1])
+            i += 1
+        elif argv[i] == '--json':
+            out = argv[i + 1]
+            i += 1
+        else:
+            names.append(argv[i])
+        i += 1
+
+    results = asyncio.run(run(names, n))
+    if out:
+        with open(out, 'w') as f:
+            json.dump({'n': n, 'cases': results}, f)
+        print(f'saved: {out}')
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+# ベンチマーク用のサーバ
+# loadgen.py から起動される. 単独で起動する場合は以下のとおり
+#   host     : PYTHONPATH=host:. python bench/server_app.py [port] [wwwroot]
+#   unix port: micropython bench/server_app.py [port] [wwwroot]
+# CPython で peak_heap を計測する場合は TMINI_TRACEMALLOC=1 を指定する (遅くなる)
+import sys
+
+_root = __file__.rsplit('/', 2)[0] if __file__.count('/') >= 2 else '.'
+if _root not in sys.path:
+    sys.path.append(_root)
+
+import gc
+import os
+import uasyncio as asyncio
+from TMiniWebServer import TMiniWebServer, logging
+
+# 静的ファイルのシナリオで使うファイル名とサイズ
+STATIC_FILES = (
+    ('static_1k.txt', 1024),
+    ('static_16k.txt', 16 * 1024),
+    ('static_128k.txt', 128 * 1024),
+)
+
+# ヒープ使用量のピーク (gc.mem_alloc を定期的に記録する)
+_peak_heap = 0
+
+async def _sample_heap():
+    global _peak_heap
+    while True:
+        alloc = gc.mem_alloc()
+        if alloc > _peak_heap:
+            _peak_heap = alloc
+        await asyncio.sleep_ms(5)
+
+# 静的ファイルを作成する
+def make_static_files(wwwroot):
+    try:
+        os.mkdir(wwwroot)
+    except OSError:
+        pass
+    line = b'0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ!\n'
+    for name, size in STATIC_FILES:
+        with open(wwwroot + '/' + name, 'wb') as f:
+            for _ in range(size // len(line)):
+                f.write(line)
+
+##-------------------------------------------------------------------------
+## ベンチマーク用のルート
+##-------------------------------------------------------------------------
+
+@TMiniWebServer.route('/bench/item/<id>/<kind>')
+async def bench_params(router):
+    params = router.route_params
+    await router.write(f"id={params['id']} kind={params['kind']}", content_type='text/plain')
+
+@TMiniWebServer.route('/bench/form', method='POST')
+async def bench_form(router):
+    await router.write(f'fields={len(router.form_params)}', content_type='text/plain')
+
+@TMiniWebServer.route('/bench/json')
+async def bench_json_get(router):
+    await router.write_json({'device': 'bench', 'samples': [{'t': i, 'v': i * 0.5} for i in range(20)]})
+
+@TMiniWebServer.route('/bench/json', method='POST')
+async def bench_json_post(router):
+    data = await router.read_json()
+    await router.write_json({'received': len(data) if data else 0})
+
+@TMiniWebServer.with_websocket('/bench/ws')
+async def bench_ws_echo(websocket):
+    while not websocket.is_closed():
+        data = await websocket.receive()
+        if data is None:
+            break
+        await websocket.send(data)
+
+# ヒープ使用量を返す
+# reset=1 を指定した場合はピークを現在の値に戻す
+@TMiniWebServer.route('/bench/mem')
+async def bench_mem(router):
+    global _peak_heap
+    gc.collect()
+    alloc = gc.mem_alloc()
+    peak = _peak_heap
+    if router.query_params.get('reset', None):
+        _peak_heap = alloc
+    await router.write_json({'alloc': alloc, 'peak': peak})
+
+async def main(port, wwwroot):
+    make_static_files(wwwroot)
+    webserver = TMiniWebServer(port=port, bindIP='127.0.0.1', wwwroot=wwwroot)
+    await webserver.start()
+    asyncio.create_task(_sample_heap())
+    print(f'bench server started on {port}')
+    while True:
+        await asyncio.sleep(3600)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.ERROR)
+    args = sys.argv[1:]
+    port = int(args[0]) if args else 8080
+    wwwroot = args[1] if len(args) > 1 else '/tmp/tmini_bench_www'
+    asyncio.run(main(port, wwwroot))
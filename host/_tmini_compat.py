@@ -0,0 +1,59 @@
+# CPython で MicroPython 固有の関数を使えるようにする
+# host/ 以下の互換モジュール (uasyncio, micropython など) から import され、1度だけ適用される
+import gc
+import os
+import sys
+import time
+import traceback
+
+# sys.print_exception(ex, file=sys.stdout)
+def _print_exception(ex, file=sys.stdout):
+    traceback.print_exception(type(ex), ex, ex.__traceback__, file=file)
+
+# ticks_xxx は MicroPython と同じく、周期的に折り返す値として扱う
+_TICKS_PERIOD = 1 << 30
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+def _ticks_ms():
+    return int(time.monotonic() * 1000) & (_TICKS_PERIOD - 1)
+
+def _ticks_us():
+    return int(time.monotonic() * 1000000) & (_TICKS_PERIOD - 1)
+
+def _ticks_add(ticks, delta):
+    return (ticks + delta) & (_TICKS_PERIOD - 1)
+
+def _ticks_diff(a, b):
+    return ((a - b + _TICKS_HALF) & (_TICKS_PERIOD - 1)) - _TICKS_HALF
+
+def _sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+def _sleep_us(us):
+    time.sleep(us / 1000000)
+
+# gc.mem_alloc / gc.mem_free
+# 環境変数 TMINI_TRACEMALLOC=1 の場合は tracemalloc で Python のヒープ使用量を返す (それ以外は 0)
+if os.environ.get('TMINI_TRACEMALLOC', '') == '1':
+    import tracemalloc
+    tracemalloc.start()
+
+def _mem_alloc():
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+def _mem_free():
+    return 0
+
+def _install():
+    if not hasattr(sys, 'print_exception'):
+        sys.print_exception = _print_exception
+    for name, func in (('ticks_ms', _ticks_ms), ('ticks_us', _ticks_us), ('ticks_add', _ticks_add),
+                       ('ticks_diff', _ticks_diff), ('sleep_ms', _sleep_ms), ('sleep_us', _sleep_us)):
+        if not hasattr(time, name):
+            setattr(time, name, func)
+    if not hasattr(gc, 'mem_alloc'):
+        gc.mem_alloc = _mem_alloc
+        gc.mem_free = _mem_free
+
+_install()
@@ -0,0 +1,17 @@
+# micropython モジュールの CPython 互換版
+import _tmini_compat
+
+def const(value):
+    return value
+
+# ネイティブコードへのコンパイル指定は何もしない
+def native(func):
+    return func
+
+viper = native
+
+def mem_info(verbose=False):
+    pass
+
+def alloc_emergency_exception_buf(size):
+    pass
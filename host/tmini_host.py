@@ -0,0 +1,130 @@
+# TMiniWebServer を Linux などのホスト (CPython) で複数プロセスで動かすランチャー
+# 実機と同じ @TMiniWebServer.route のモジュールを変更せずに読み込み、
+# SO_REUSEPORT で同じポートを共有するワーカーを CPU コア数だけ起動する
+#
+#   python host/tmini_host.py --port 8080 --workers 4 --wwwroot wwwroot route.sample_basic route.sample_restapi
+#
+# 注意: レスポンスキャッシュ・pub/sub のハブ・WebSocket の接続はワーカー毎に独立している
+import argparse
+import os
+import signal
+import sys
+import time
+
+_HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+for _path in (_HOST_DIR, os.path.dirname(_HOST_DIR), os.getcwd()):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+import uasyncio
+
+# ワーカーが異常終了した場合に再起動する間隔(秒)
+RESTART_DELAY = 1.0
+
+# ルートを登録するモジュールを読み込む
+# ワーカーを起動する前に読み込み、各ワーカーはコピーを共有する (fork)
+def load_modules(args):
+    from TMiniWebServer import logging
+    logging.basicConfig(level=getattr(logging, args.log_level.upper()))
+    for name in args.modules:
+        __import__(name)
+
+# ワーカーの処理 (サーバを起動して、SIGTERM / SIGINT まで動かす)
+def run_worker(args):
+    import asyncio
+    if args.uvloop:
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            print('uvloop is not installed. using asyncio.', file=sys.stderr)
+
+    from TMiniWebServer import TMiniWebServer
+    uasyncio.reuse_port = args.workers > 1
+    uasyncio.listen_backlog = args.backlog
+
+    async def main():
+        webserver = TMiniWebServer(port=args.port, bindIP=args.bind, wwwroot=os.path.abspath(args.wwwroot))
+        await webserver.start()
+        print(f'worker {os.getpid()} listening on {args.bind}:{args.port}', file=sys.stderr)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        webserver.stop()
+
+    asyncio.run(main())
+
+# ワーカーのプロセスを起動する
+# return: プロセスID
+def spawn_worker(args):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code = 0
+        try:
+            run_worker(args)
+        except BaseException as ex:
+            if not isinstance(ex, (KeyboardInterrupt, SystemExit)):
+                sys.print_exception(ex, sys.stderr)
+                code = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+# ワーカーを起動して監視する
+# 異常終了したワーカーは再起動し、SIGTERM / SIGINT で全てのワーカーを停止する
+def run_master(args):
+    workers = set()
+    stopping = False
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    for _ in range(args.workers):
+        workers.add(spawn_worker(args))
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping and status != 0:
+            print(f'worker {pid} exited ({status}). restarting.', file=sys.stderr)
+            time.sleep(RESTART_DELAY)
+            workers.add(spawn_worker(args))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='run TMiniWebServer on CPython with multiple workers')
+    parser.add_argument('modules', nargs='*', help='route modules to import (ex: route.sample_basic)')
+    parser.add_argument('--bind', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--wwwroot', default='wwwroot')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    parser.add_argument('--backlog', type=int, default=128, help='listen backlog per worker')
+    parser.add_argument('--uvloop', action='store_true', help='use uvloop if installed')
+    parser.add_argument('--log-level', default='warning', choices=('debug', 'info', 'warning', 'error'))
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    load_modules(args)
+    if args.workers <= 1:
+        run_worker(args)
+    else:
+        run_master(args)
@@ -0,0 +1,73 @@
+# uasyncio モジュールの CPython 互換版
+# MicroPython のストリームは str も書き込めるため、start_server / open_connection の writer を包んで変換する
+import asyncio as _asyncio
+from asyncio import *
+import _tmini_compat
+
+# start_server の設定 (tmini_host.py のランチャーが変更する)
+reuse_port = False      # SO_REUSEPORT で複数のプロセスが同じポートを待ち受ける
+listen_backlog = None   # 待ち受けキューの長さ (None: 呼び出し側の指定どおり)
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+# 書き出しストリームのラッパー
+class _StreamWriter:
+    def __init__(self, writer):
+        self._writer = writer
+
+    # str は UTF-8 にする. bytearray や memoryview は呼び出し側が再利用するため複製する
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        elif not isinstance(data, bytes):
+            data = bytes(data)
+        self._writer.write(data)
+
+    # MicroPython の close はソケットをすぐに閉じるため、drain で待っているタスクは書き込みに失敗して戻る
+    # CPython は送信バッファが空になるまで閉じないため、相手が受信せず drain が止まっている場合は破棄して閉じる
+    def close(self):
+        transport = self._writer.transport
+        if transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]:
+            transport.abort()
+        else:
+            self._writer.close()
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+async def start_server(callback, host, port, backlog=5, **kwargs):
+    if reuse_port:
+        kwargs.setdefault('reuse_port', True)
+    if listen_backlog:
+        backlog = listen_backlog
+    return await _asyncio.start_server(lambda reader, writer: callback(reader, _StreamWriter(writer)),
+                                       host, port, backlog=backlog, **kwargs)
+
+async def open_connection(host, port, **kwargs):
+    reader, writer = await _asyncio.open_connection(host, port, **kwargs)
+    return reader, _StreamWriter(writer)
+
+# 別スレッド(割り込み)から set できるフラグ
+class ThreadSafeFlag:
+    def __init__(self):
+        self._event = _asyncio.Event()
+        try:
+            self._loop = _asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+
+    def set(self):
+        loop = self._loop
+        if loop is None:
+            self._event.set()
+        else:
+            loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._event.clear()
+
+    async def wait(self):
+        self._loop = _asyncio.get_running_loop()
+        await self._event.wait()
+        self._event.clear()
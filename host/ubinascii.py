@@ -0,0 +1,2 @@
+# ubinascii モジュールの CPython 互換版
+from binascii import *
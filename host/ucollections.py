@@ -0,0 +1,2 @@
+# ucollections モジュールの CPython 互換版
+from collections import *
@@ -0,0 +1,2 @@
+# uerrno モジュールの CPython 互換版
+from errno import *
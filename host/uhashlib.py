@@ -0,0 +1,2 @@
+# uhashlib モジュールの CPython 互換版
+from hashlib import *
@@ -0,0 +1,2 @@
+# uio モジュールの CPython 互換版
+from io import *
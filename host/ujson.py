@@ -0,0 +1,2 @@
+# ujson モジュールの CPython 互換版
+from json import *
@@ -0,0 +1,2 @@
+# uos モジュールの CPython 互換版
+from os import *
@@ -0,0 +1,2 @@
+# urandom モジュールの CPython 互換版
+from random import *
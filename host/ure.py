@@ -0,0 +1,2 @@
+# ure モジュールの CPython 互換版
+from re import *
@@ -0,0 +1,2 @@
+# uselect モジュールの CPython 互換版
+from select import *
@@ -0,0 +1,2 @@
+# usocket モジュールの CPython 互換版
+from socket import *
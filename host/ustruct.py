@@ -0,0 +1,2 @@
+# ustruct モジュールの CPython 互換版
+from struct import *
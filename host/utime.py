@@ -0,0 +1,3 @@
+# utime モジュールの CPython 互換版
+import _tmini_compat
+from time import *
@@ -29,3 +29,12 @@ async def recv_form_data(router):
     """
     await router.write(html)
 
+
+##-------------------------------------------------------------------------
+## テンプレート
+## /templates/sample.html を変換して、チャンク単位で出力する
+##-------------------------------------------------------------------------
+@TMiniWebServer.route('/template')
+async def template_sample(router):
+    items = [('query', router.query_params), ('form', router.form_params)]
+    await router.write_template('sample.html', 'テンプレートのサンプル', items)
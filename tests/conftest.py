@@ -0,0 +1,9 @@
+# テストは CPython で実行する (host/ の互換モジュールで uasyncio などを CPython に割り当てる)
+#   python -m pytest tests
+import os
+import sys
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (os.path.join(_ROOT, 'host'), _ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
@@ -0,0 +1,90 @@
+import uasyncio as asyncio
+
+from TMiniWebServer import TMiniWebServer
+from TMiniWebServer.tminihub import SLOW_EVICT
+
+_UPGRADE = (b'GET /ws HTTP/1.1\r\n'
+            b'connection: Upgrade\r\n'
+            b'upgrade: websocket\r\n'
+            b'sec-websocket-key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n')
+_EVENTS = b'GET /events HTTP/1.1\r\n\r\n'
+
+# 遅い購読者として追い出された接続で、受信を待っているハンドラが戻ることを確認する
+# (送信キューが満杯の状態は is_full を差し替えて作る)
+async def _evict_and_wait(raw):
+    class Server(TMiniWebServer):
+        _decorate_route_handlers = []
+
+    subscribed = asyncio.Event()
+    returned = asyncio.Event()
+
+    @Server.with_websocket('/ws')
+    async def ws(websocket):
+        websocket.subscribe('t')
+        websocket._send_queue.is_full = lambda: True
+        subscribed.set()
+        await websocket.receive()
+        returned.set()
+
+    @Server.route('/events')
+    async def events(router):
+        async with router.event_stream() as stream:
+            stream.subscribe('t')
+            stream._send_queue.is_full = lambda: True
+            subscribed.set()
+            await stream.wait_closed()
+        returned.set()
+
+    server = Server(port=0, bindIP='127.0.0.1', wwwroot='/nonexistent', ws_ping_interval=0, sse_heartbeat=0)
+    server.hub.slow_policy = SLOW_EVICT
+    await server.start()
+    try:
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        await asyncio.wait_for(subscribed.wait(), 2)
+        server.hub.publish('t', 'x')
+        await asyncio.wait_for(returned.wait(), 2)
+        # 接続も閉じられている
+        await asyncio.wait_for(reader.read(-1), 2)
+        writer.close()
+        return server.hub.connections()
+    finally:
+        server.stop()
+
+def test_evicted_websocket_handler_returns():
+    assert asyncio.run(_evict_and_wait(_UPGRADE)) == 0
+
+def test_evicted_event_stream_handler_returns():
+    assert asyncio.run(_evict_and_wait(_EVENTS)) == 0
+
+# 受信しない (送信のみの) ハンドラでも、相手が受信しなくなった接続は送信の詰まりで切断する
+def test_stalled_send_only_websocket_is_closed():
+    class Server(TMiniWebServer):
+        _decorate_route_handlers = []
+
+    returned = asyncio.Event()
+
+    @Server.with_websocket('/ws')
+    async def ws(websocket):
+        while await websocket.send(b'x' * 16000):
+            pass
+        returned.set()
+
+    async def main():
+        server = Server(port=0, bindIP='127.0.0.1', wwwroot='/nonexistent', ws_ping_interval=1, ws_pong_timeout=1)
+        await server.start()
+        try:
+            port = server._server.sockets[0].getsockname()[1]
+            # 応答を読まないクライアント
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(_UPGRADE)
+            await writer.drain()
+            await asyncio.wait_for(returned.wait(), 5)
+            writer.close()
+            return server.hub.connections()
+        finally:
+            server.stop()
+
+    assert asyncio.run(main()) == 0
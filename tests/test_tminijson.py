@@ -0,0 +1,49 @@
+import json
+
+import pytest
+import uasyncio as asyncio
+
+from TMiniWebServer.tminijson import has_iterator, iterencode, dump_async
+
+# 書き込んだ文字列を溜めるストリーム
+class _Writer:
+    def __init__(self):
+        self.pieces = []
+
+    async def write(self, data):
+        self.pieces.append(data)
+
+    def getvalue(self):
+        return ''.join(self.pieces)
+
+async def _records(n):
+    for i in range(n):
+        yield {'i': i, 'values': (j for j in range(i))}
+
+def _dump(obj):
+    writer = _Writer()
+    asyncio.run(dump_async(obj, writer))
+    return writer.getvalue()
+
+def test_ordinary_values_have_no_iterator():
+    assert not has_iterator({'a': [1, 2.5, None, True, 'x'], 'b': (1, {'c': 'd'})})
+    assert has_iterator({'a': [1, (i for i in range(2))]})
+    assert has_iterator({'records': _records(1)})
+
+def test_nested_async_iterator_is_encoded():
+    assert json.loads(_dump({'records': _records(3), 'n': 3})) == {
+        'records': [{'i': 0, 'values': []}, {'i': 1, 'values': [0]}, {'i': 2, 'values': [0, 1]}],
+        'n': 3,
+    }
+
+def test_iterencode_matches_dumps():
+    obj = {'a': [1, 2.5, None, True, 'x"y'], 'b': {'c': (1, 2)}, 3: 'k'}
+    assert json.loads(''.join(iterencode(obj))) == json.loads(json.dumps(obj))
+
+@pytest.mark.parametrize('value', [b'ab', bytearray(b'ab'), memoryview(b'ab')])
+def test_bytes_are_not_arrays(value):
+    assert not has_iterator({'data': value})
+    with pytest.raises(TypeError):
+        ''.join(iterencode({'data': value}))
+    with pytest.raises(TypeError):
+        _dump({'data': value})
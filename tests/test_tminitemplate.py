@@ -0,0 +1,19 @@
+from TMiniWebServer.tminitemplate import _escape, compile_template
+
+def _render(source, *args):
+    namespace = {'_e': _escape}
+    exec(compile_template(source), namespace)
+    return ''.join(namespace['render'](*args))
+
+def test_escape_html_characters():
+    assert _escape('<a href="x">&</a>') == '&lt;a href=&quot;x&quot;&gt;&amp;&lt;/a&gt;'
+
+def test_escape_single_quote():
+    assert _escape("it's") == 'it&#39;s'
+
+def test_single_quoted_attribute_cannot_be_broken_out_of():
+    html = _render("{% args v %}<input value='{{ v }}'>", "x' onfocus='alert(1)")
+    assert html == "<input value='x&#39; onfocus=&#39;alert(1)'>"
+
+def test_raw_output_is_not_escaped():
+    assert _render("{% args v %}{{! v }}", "'<b>'") == "'<b>'"
@@ -0,0 +1,160 @@
+import gzip
+
+import uasyncio as asyncio
+
+from TMiniWebServer import TMiniWebServer
+
+# ルートの登録がテスト毎に混ざらないよう、デコレータの登録先を分けたサーバ
+def _server_class():
+    class _Server(TMiniWebServer):
+        _decorate_route_handlers = []
+    return _Server
+
+# 応答をバッファに溜める書き出しストリーム
+class _Writer:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, data):
+        self.buf.extend(data.encode() if isinstance(data, str) else bytes(data))
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 50000)
+
+# ソケットを使わずにリクエストを1つ処理する
+# return: 応答全体
+async def _request_raw(server, raw):
+    reader = asyncio.StreamReader()
+    reader.feed_data(raw)
+    reader.feed_eof()
+    writer = _Writer()
+    await server._server_proc(reader, writer)
+    return bytes(writer.buf)
+
+# return: (ステータス行, ヘッダの dict, 内容)
+async def _request(server, raw):
+    head, _, body = (await _request_raw(server, raw)).partition(b'\r\n\r\n')
+    lines = head.decode().split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return lines[0], headers, body
+
+def test_cached_route_writes_middleware_headers_per_request():
+    Server = _server_class()
+    calls = []
+    ids = []
+
+    @Server.route('/cached', cache_ttl=60)
+    async def cached(router):
+        calls.append(1)
+        await router.response.write_response('body', headers={'x-handler': 'h'})
+
+    async def request_id(router, next):
+        router.response.add_header('x-request-id', str(len(ids)))
+        ids.append(1)
+        await next(router)
+
+    async def main():
+        server = Server(wwwroot='/nonexistent')
+        server.use(request_id)
+        server._compose_middlewares()
+        return [await _request(server, b'GET /cached HTTP/1.1\r\n\r\n') for _ in range(3)]
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert [headers['x-request-id'] for _, headers, _ in results] == ['0', '1', '2']
+    for status, headers, body in results:
+        assert status == 'HTTP/1.1 200 OK'
+        assert headers['x-handler'] == 'h'
+        assert body == b'body'
+
+def test_body_limits_apply_to_every_method():
+    Server = _server_class()
+
+    @Server.route('/item', method='PATCH')
+    async def patch(router):
+        await router.response.write_response(await router.request.read_content())
+
+    @Server.route('/item', method='DELETE')
+    async def delete(router):
+        await router.response.write_response(await router.request.read_content())
+
+    async def main():
+        server = Server(wwwroot='/nonexistent', max_body=8)
+        server._compose_middlewares()
+        too_large = await _request(server, b'PATCH /item HTTP/1.1\r\ncontent-length: 100\r\n\r\n' + b'x' * 100)
+        continued = await _request_raw(server, b'DELETE /item HTTP/1.1\r\ncontent-length: 4\r\nexpect: 100-continue\r\n\r\nbody')
+        return too_large, continued
+
+    too_large, continued = asyncio.run(main())
+    assert too_large[0] == 'HTTP/1.1 413 Request Entity Too Large'
+    assert continued.startswith(b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK\r\n')
+    assert continued.endswith(b'\r\n\r\nbody')
+
+# gzip で格納したファイルを1つ持つフリーズモジュールの代わり
+class _GzipAssets:
+    BODY = gzip.compress(b'hello')
+    ASSETS = {
+        'app.js': (BODY, len(BODY), 'application/javascript', '"1"', True),
+        'only.js': (BODY, len(BODY), 'application/javascript', '"2"', True),
+    }
+
+def test_gzip_asset_honours_accept_encoding(tmp_path):
+    (tmp_path / 'app.js').write_bytes(b'hello')
+    Server = _server_class()
+
+    async def main():
+        server = Server(wwwroot=str(tmp_path), frozen_assets=_GzipAssets)
+        server.assets.open()
+        return [await _request(server, raw) for raw in (
+            b'GET /app.js HTTP/1.1\r\naccept-encoding: gzip, deflate\r\n\r\n',
+            b'GET /app.js HTTP/1.1\r\n\r\n',
+            b'GET /app.js HTTP/1.1\r\naccept-encoding: *, gzip;q=0\r\n\r\n',
+            b'GET /only.js HTTP/1.1\r\naccept-encoding: identity\r\n\r\n',
+        )]
+
+    accepted, fallback, refused, missing = asyncio.run(main())
+    assert accepted[1]['content-encoding'] == 'gzip'
+    assert accepted[1]['vary'] == 'Accept-Encoding'
+    assert gzip.decompress(accepted[2]) == b'hello'
+    for status, headers, body in (fallback, refused):
+        assert status == 'HTTP/1.1 200 OK'
+        assert 'content-encoding' not in headers
+        assert headers['vary'] == 'Accept-Encoding'
+        assert body == b'hello'
+    assert missing[0] == 'HTTP/1.1 406 Not Acceptable'
+    assert missing[1]['vary'] == 'Accept-Encoding'
+
+def test_missing_resource_is_404_for_every_method(tmp_path):
+    (tmp_path / 'index.html').write_bytes(b'hi')
+    Server = _server_class()
+
+    @Server.route('/api/item', method='POST')
+    async def post(router):
+        await router.response.write_response('ok')
+
+    async def main():
+        server = Server(wwwroot=str(tmp_path))
+        server._compose_middlewares()
+        results = {}
+        for method, path in (('GET', '/none'), ('POST', '/none'), ('DELETE', '/none'), ('PUT', '/none'),
+                             ('DELETE', '/index.html'), ('GET', '/api/item'), ('DELETE', '/api/item')):
+            results[method, path] = await _request(server, f'{method} {path} HTTP/1.1\r\n\r\n'.encode())
+        return results
+
+    results = asyncio.run(main())
+    for method in ('GET', 'POST', 'DELETE', 'PUT'):
+        assert results[method, '/none'][0] == 'HTTP/1.1 404 Not Found'
+    assert results['DELETE', '/index.html'][0] == 'HTTP/1.1 405 Method Not Allowed'
+    assert results['DELETE', '/index.html'][1]['allow'] == 'GET, HEAD, OPTIONS'
+    for method in ('GET', 'DELETE'):
+        assert results[method, '/api/item'][0] == 'HTTP/1.1 405 Method Not Allowed'
+        assert results[method, '/api/item'][1]['allow'] == 'POST, OPTIONS'
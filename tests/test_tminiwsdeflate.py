@@ -0,0 +1,33 @@
+import zlib
+
+import pytest
+
+from TMiniWebServer import tminiwsdeflate
+from TMiniWebServer.tminiwsdeflate import negotiate
+
+pytestmark = pytest.mark.skipif(not tminiwsdeflate.AVAILABLE, reason='deflate is not available')
+
+def _compress(data, wbits):
+    c = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits)
+    return (c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+def test_smaller_client_window_is_echoed():
+    deflate, response = negotiate('permessage-deflate; client_max_window_bits=9', 10)
+    assert 'client_max_window_bits=9' in response
+    assert deflate.client_wbits == 9
+    data = b'abcdefgh' * 200
+    assert deflate.decompress(_compress(data, 9), 4096) == data
+
+def test_client_window_without_value_uses_server_limit():
+    deflate, response = negotiate('permessage-deflate; client_max_window_bits', 10)
+    assert 'client_max_window_bits=10' in response
+    assert deflate.client_wbits == 10
+
+def test_larger_client_window_is_limited():
+    deflate, response = negotiate('permessage-deflate; client_max_window_bits=15', 10)
+    assert 'client_max_window_bits=10' in response
+    assert deflate.client_wbits == 10
+
+@pytest.mark.parametrize('value', ['7', '16', 'x'])
+def test_invalid_client_window_is_declined(value):
+    assert negotiate('permessage-deflate; client_max_window_bits=' + value, 10) == (None, None)
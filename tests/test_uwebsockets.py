@@ -0,0 +1,63 @@
+from array import array
+
+import pytest
+
+from TMiniWebServer.uwebsockets import (Websocket, OP_BYTES, FRAME_HEADROOM,
+                                        _itemsize, buffer_len, payload_of, frame_buffer, frame_view)
+
+# memoryview.itemsize のないポート (rp2 など) の memoryview の代わり
+class _NoItemsize:
+    def __init__(self, buf):
+        self._mv = memoryview(buf)
+
+    def __len__(self):
+        return len(self._mv)
+
+    def __getitem__(self, index):
+        return self._mv[index]
+
+class _Writer:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, data):
+        self.buf.extend(data)
+
+@pytest.mark.parametrize('buf', [b'abcd', bytearray(b'abcd'), array('B', b'abcd'), memoryview(b'abcd')])
+def test_byte_buffers_are_accepted(buf):
+    assert buffer_len(buf) == 4
+    assert payload_of(buf) == (OP_BYTES, buf)
+
+@pytest.mark.parametrize('buf', [array('h', [1, 2]), array('f', [1.0]), memoryview(array('I', [1]))])
+def test_wide_buffers_are_rejected(buf):
+    with pytest.raises(TypeError):
+        buffer_len(buf)
+    with pytest.raises(TypeError):
+        payload_of(buf)
+
+def test_itemsize_without_memoryview_itemsize():
+    assert _itemsize(_NoItemsize(array('h', [1, 2]))) == 2
+    assert _itemsize(_NoItemsize(bytearray(b'ab'))) == 1
+    assert _itemsize(_NoItemsize(b'')) == 1
+
+def test_send_rejects_wide_array_before_writing():
+    writer = _Writer()
+    ws = Websocket(writer=writer)
+    with pytest.raises(TypeError):
+        ws.send(array('h', [1, 2, 3]))
+    assert writer.buf == b''
+
+def test_send_byte_array_header_has_byte_length():
+    writer = _Writer()
+    ws = Websocket(writer=writer)
+    ws.send(array('B', range(5)))
+    assert bytes(writer.buf) == bytes((0x82, 5)) + bytes(range(5))
+
+def test_frame_view_rejects_wide_array():
+    with pytest.raises(TypeError):
+        frame_view(array('h', [0] * (FRAME_HEADROOM + 4)), 4)
+
+def test_frame_view_byte_buffer():
+    buf = frame_buffer(3)
+    buf[FRAME_HEADROOM:] = b'xyz'
+    assert bytes(frame_view(buf, 3)) == bytes((0x82, 3)) + b'xyz'
@@ -0,0 +1,58 @@
+"""
+wwwroot 以下のファイルを、ファームウェアにフリーズする Python のモジュールに変換するツール
+
+  python tools/tmini_freeze.py wwwroot frozen_www.py [--gzip] [--mpy]
+
+生成したモジュールをファームウェアのビルドの manifest.py に module('frozen_www.py') で追加し、
+デバイスでは TMiniWebServer(frozen_assets='frozen_www') を指定する。
+フリーズした bytes はフラッシュ上に置かれたまま RAM にコピーされないため、静的ファイルにヒープを使わない。
+--mpy を指定した場合は mpy-cross で .mpy にもコンパイルする (フリーズせずにファイルシステムに置く場合)。
+"""
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tmini_pack import PACK_FLAG_GZIP, list_files, make_etag, load_asset
+
+_HEADER = '''# Generated by tools/tmini_freeze.py from {root}. Do not edit.
+# パス: (内容, サイズ, MIME, ETag, gzip)
+ASSETS = {{
+'''
+
+# bytes を1行が長くなりすぎないように分けて出力する
+def _bytes_literal(data, width=96):
+    if len(data) <= width:
+        return repr(data)
+    parts = [repr(data[i:i + width]) for i in range(0, len(data), width)]
+    return '(\n        ' + '\n        '.join(parts) + ')'
+
+# モジュールを作成する
+# return: [(パス, MIME, 元のサイズ, 格納したサイズ, gzip)]
+def build_module(root, out_path, use_gzip=False):
+    result = []
+    with open(out_path, 'w') as f:
+        f.write(_HEADER.format(root=os.path.basename(os.path.normpath(root))))
+        for name, path in list_files(root):
+            mime, flags, stored, size = load_asset(path, name, use_gzip)
+            gz = bool(flags & PACK_FLAG_GZIP)
+            f.write(f'    {name!r}: ({_bytes_literal(stored)}, {len(stored)}, {mime!r}, {make_etag(stored)!r}, {gz}),\n')
+            result.append((name, mime, size, len(stored), gz))
+        f.write('}\n')
+    return result
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) != 2:
+        print(__doc__)
+        return 1
+    result = build_module(args[0], args[1], '--gzip' in argv)
+    for name, mime, size, stored, gz in result:
+        print(f"{name:<40} {mime:<28} {size:>8} -> {stored:>8}{' gzip' if gz else ''}")
+    print(f'{len(result)} files -> {args[1]}')
+    if '--mpy' in argv:
+        subprocess.run(['mpy-cross', args[1]], check=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
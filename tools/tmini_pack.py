@@ -0,0 +1,117 @@
+"""
+wwwroot 以下のファイルを1つのパックファイルにまとめるツール
+
+  python tools/tmini_pack.py wwwroot assets.pack [--gzip]
+
+--gzip を指定した場合は、テキスト系のファイルを gzip で圧縮して格納する (小さくなる場合のみ)。
+デバイスでは TMiniWebServer(asset_pack='/assets.pack') を指定すると、パックから静的ファイルを返す。
+
+パックの形式 (TMiniWebServer/tministatic.py と同じ):
+  ヘッダ: b'TMPK' / バージョン(B) / 予約(B) / ファイル数(H) / インデックスのサイズ(I)
+  インデックス: ファイル毎に パス長(H) パス / MIME長(B) MIME / ETag長(B) ETag / フラグ(B) / 位置(I) / サイズ(I)
+  以降: ファイルの内容 (位置はパックの先頭からのバイト数)
+"""
+import gzip
+import hashlib
+import importlib.util
+import os
+import struct
+import sys
+
+PACK_MAGIC = b'TMPK'
+PACK_VERSION = 1
+PACK_HEADER = '<4sBBHI'
+PACK_FLAG_GZIP = 0x01
+
+# gzip で圧縮するメディアタイプ
+_COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+
+_UTIL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TMiniWebServer', 'tminiwebserver_util.py')
+
+_util = None
+
+# MIME タイプはサーバと同じ表を使う (tminiwebserver_util は CPython でもそのまま読み込める)
+def _load_util():
+    spec = importlib.util.spec_from_file_location('_tmini_util', _UTIL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TMiniWebServerUtil
+
+# wwwroot 以下のファイルを (パックでのパス, ファイルのパス) で列挙する
+def list_files(root):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            files.append((os.path.relpath(path, root).replace(os.sep, '/'), path))
+    return files
+
+# ファイルの内容から ETag を作る
+def make_etag(data):
+    return '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+
+# ファイルを読み込み、格納する内容を作る
+# return: (MIME, フラグ, 格納する内容, 元のサイズ)
+def load_asset(path, name, use_gzip=False):
+    global _util
+    if _util is None:
+        _util = _load_util()
+    with open(path, 'rb') as f:
+        data = f.read()
+    mime = _util.get_minetype_from_ext(name)
+    flags = 0
+    stored = data
+    if use_gzip and mime.startswith(_COMPRESSIBLE):
+        compressed = gzip.compress(data, 9, mtime=0)
+        if len(compressed) < len(data):
+            stored = compressed
+            flags |= PACK_FLAG_GZIP
+    return mime, flags, stored, len(data)
+
+# パックを作成する
+# return: [(パス, MIME, 元のサイズ, 格納したサイズ, gzip)]
+def build_pack(root, out_path, use_gzip=False):
+    entries = []
+    for name, path in list_files(root):
+        mime, flags, stored, size = load_asset(path, name, use_gzip)
+        entries.append((name, mime, make_etag(stored), flags, stored, size))
+
+    index = bytearray()
+    for name, mime, etag, flags, stored, _ in entries:
+        index += struct.pack('<H', len(name.encode())) + name.encode()
+        index += struct.pack('<B', len(mime)) + mime.encode()
+        index += struct.pack('<B', len(etag)) + etag.encode()
+        index += struct.pack('<BII', flags, 0, 0)      # 位置とサイズは後で埋める
+
+    # インデックスの位置・サイズを埋める
+    offset = struct.calcsize(PACK_HEADER) + len(index)
+    pos = 0
+    for name, mime, etag, flags, stored, _ in entries:
+        pos += 2 + len(name.encode()) + 1 + len(mime) + 1 + len(etag)
+        struct.pack_into('<BII', index, pos, flags, offset, len(stored))
+        pos += 9
+        offset += len(stored)
+
+    with open(out_path, 'wb') as f:
+        f.write(struct.pack(PACK_HEADER, PACK_MAGIC, PACK_VERSION, 0, len(entries), len(index)))
+        f.write(index)
+        for entry in entries:
+            f.write(entry[4])
+
+    return [(name, mime, size, len(stored), bool(flags & PACK_FLAG_GZIP))
+            for name, mime, etag, flags, stored, size in entries]
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    if len(args) != 2:
+        print(__doc__)
+        return 1
+    result = build_pack(args[0], args[1], '--gzip' in argv)
+    for name, mime, size, stored, gz in result:
+        print(f"{name:<40} {mime:<28} {size:>8} -> {stored:>8}{' gzip' if gz else ''}")
+    print(f'{len(result)} files -> {args[1]} ({os.path.getsize(args[1])} bytes)')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
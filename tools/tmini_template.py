@@ -0,0 +1,67 @@
+"""
+テンプレートをホスト側で Python のモジュールに変換するツール
+
+  python tools/tmini_template.py templates templates_c [--mpy]
+
+templates 以下の全てのテンプレートを templates_c/<name>_html.py に変換する。
+--mpy を指定した場合は mpy-cross で .mpy にコンパイルする。
+デバイスでは TMiniTemplate.precompiled_package = 'templates_c' を指定すると、変換済みのモジュールを使用する。
+"""
+import importlib.util
+import os
+import subprocess
+import sys
+import types
+
+_COMPILER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'TMiniWebServer', 'tminitemplate.py')
+
+_HEADER = '''# Generated by tools/tmini_template.py from {name}. Do not edit.
+from TMiniWebServer.tminitemplate import _escape as _e, TMiniTemplate
+_include = TMiniTemplate.render
+
+'''
+
+# TMiniWebServer パッケージは MicroPython 用のモジュールを import するため、tminitemplate.py のみ読み込む
+# tminitemplate は from . import logging のみに依存するため、ダミーのパッケージで読み込む
+def _load_compiler():
+    package = types.ModuleType('_tmini_tools')
+    package.__path__ = []
+    logging = types.ModuleType('_tmini_tools.logging')
+    logging.getLogger = lambda name=None: types.SimpleNamespace(debug=lambda *a: None)
+    sys.modules['_tmini_tools'] = package
+    sys.modules['_tmini_tools.logging'] = logging
+    spec = importlib.util.spec_from_file_location('_tmini_tools.tminitemplate', _COMPILER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def main(argv):
+    if len(argv) < 3:
+        print(__doc__)
+        return 1
+    src_dir, out_dir = argv[1], argv[2]
+    use_mpy = '--mpy' in argv
+    compiler = _load_compiler()
+
+    os.makedirs(out_dir, exist_ok=True)
+    init_path = os.path.join(out_dir, '__init__.py')
+    if not os.path.exists(init_path):
+        open(init_path, 'w').close()
+
+    for root, _, files in os.walk(src_dir):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            name = os.path.relpath(path, src_dir).replace(os.sep, '/')
+            with open(path, 'r', encoding='utf-8') as f:
+                code = compiler.compile_template(f.read())
+            out_path = os.path.join(out_dir, compiler.module_name(name) + '.py')
+            with open(out_path, 'w', encoding='utf-8') as f:
+                f.write(_HEADER.format(name=name) + code)
+            print(f'{name} -> {out_path}')
+            if use_mpy:
+                subprocess.run(['mpy-cross', out_path], check=True)
+                os.remove(out_path)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))